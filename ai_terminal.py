@@ -4,13 +4,22 @@ import os
 import sys
 import re
 import shlex
-from typing import List, Dict, Any, Optional, Tuple
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple, Callable
 
 # Import the base terminal functionality
-from terminal import Terminal, Command
+from terminal import Terminal, Command, directory_sizes
+from directory_cache import directory_cache
 
 class NLPCommand(Command):
     """Natural language processing command"""
+    # A pattern's leading word, or its leading group of alternative words
+    LEADING_KEYWORDS = re.compile(r"\(\?:([\w ]+(?:\|[\w ]+)*)\)|(\w+)")
+    # Resolved queries remembered per terminal
+    INTENT_CACHE_SIZE = 256
+    
     def __init__(self, terminal):
         super().__init__("nlp", "Process natural language commands")
         self.terminal = terminal
@@ -45,6 +54,54 @@ class NLPCommand(Command):
             (r"(?:exit|quit|close) (?:terminal|program|application)", self._exit_terminal),
             (r"clear (?:the )?(?:screen|terminal)", self._clear_screen),
         ]
+        self._compile_patterns()
+        # Normalized query -> (handler, arguments), or None if nothing matched;
+        # ordered from least to most recently used
+        self._intents: "OrderedDict[str, Optional[Tuple[Callable, Tuple[Optional[str], ...]]]]" = OrderedDict()
+        self.intent_hits = 0
+        self.intent_misses = 0
+    
+    def _compile_patterns(self):
+        """Precompile the patterns and index them by their leading keywords
+        
+        Every pattern starts with a literal word or a group of alternative
+        words, and re.search can only match a query containing one of them.
+        Checking for those keywords first means most patterns, and for
+        unrecognised queries usually all of them, are never run.
+        """
+        self._compiled = [(re.compile(pattern, re.IGNORECASE), handler) for pattern, handler in self.command_patterns]
+        index: Dict[str, List[int]] = {}
+        self._unindexed: List[int] = []
+        for i, (pattern, _) in enumerate(self.command_patterns):
+            lead = self.LEADING_KEYWORDS.match(pattern)
+            if lead is None:
+                # Can't tell what it starts with, so always try it
+                self._unindexed.append(i)
+                continue
+            for keyword in (lead.group(1) or lead.group(2)).split("|"):
+                index.setdefault(keyword.lower(), []).append(i)
+        self._keyword_index = list(index.items())
+    
+    def resolve(self, query: str) -> Optional[Tuple[Callable, Tuple[Optional[str], ...]]]:
+        """Return the handler and arguments for the first pattern matching query"""
+        if query.isascii():
+            lowered = query.lower()
+            candidates = set(self._unindexed)
+            for keyword, patterns in self._keyword_index:
+                if keyword in lowered:
+                    candidates.update(patterns)
+            order = sorted(candidates)
+        else:
+            # Case-insensitive matching of non-ASCII text doesn't line up
+            # with str.lower(), so don't filter
+            order = range(len(self._compiled))
+        
+        for i in order:
+            pattern, handler = self._compiled[i]
+            match = pattern.search(query)
+            if match:
+                return handler, match.groups()
+        return None
     
     def execute(self, args: List[str]) -> str:
         # Join all arguments to form the natural language query
@@ -56,14 +113,40 @@ class NLPCommand(Command):
         if query.lower() in ["help", "examples"]:
             return self._show_examples()
         
-        # Try to match the query against known patterns
-        for pattern, handler in self.command_patterns:
-            match = re.search(pattern, query, re.IGNORECASE)
-            if match:
-                return handler(*match.groups())
+        # Match the query against the known patterns
+        resolved = self._resolve_cached(query)
+        if resolved is not None:
+            handler, arguments = resolved
+            return handler(*arguments)
         
         return f"I don't understand '{query}'. Type 'nlp help' for examples of commands I understand."
     
+    def _resolve_cached(self, query: str) -> Optional[Tuple[Callable, Tuple[Optional[str], ...]]]:
+        """resolve(), remembering results for repeated queries"""
+        # Arguments are file names, so case matters; only whitespace is normalized
+        key = " ".join(query.split())
+        if key in self._intents:
+            self._intents.move_to_end(key)
+            self.intent_hits += 1
+            return self._intents[key]
+        
+        self.intent_misses += 1
+        resolved = self.resolve(key)
+        self._intents[key] = resolved
+        if len(self._intents) > self.INTENT_CACHE_SIZE:
+            self._intents.popitem(last=False)
+        return resolved
+    
+    def intent_cache_stats(self) -> Dict[str, Any]:
+        lookups = self.intent_hits + self.intent_misses
+        return {
+            'size': len(self._intents),
+            'max_size': self.INTENT_CACHE_SIZE,
+            'hits': self.intent_hits,
+            'misses': self.intent_misses,
+            'hit_ratio': self.intent_hits / lookups if lookups else 0.0,
+        }
+    
     def help(self) -> str:
         return "nlp: Process natural language commands. Type 'nlp help' for examples."
     
@@ -116,7 +199,7 @@ class NLPCommand(Command):
     
     def _remove_item(self, item_name: str) -> str:
         item_name = item_name.strip()
-        if os.path.isdir(item_name):
+        if directory_cache.is_dir(self.terminal.resolve_path(item_name)):
             return self.terminal.execute_command(f"rm -r {shlex.quote(item_name)}")
         else:
             return self.terminal.execute_command(f"rm {shlex.quote(item_name)}")
@@ -126,57 +209,72 @@ class NLPCommand(Command):
         # For our terminal, we'll simulate it with a combination of copy and remove
         source = source.strip()
         destination = destination.strip()
+        source_path = self.terminal.resolve_path(source)
+        destination_path = self.terminal.resolve_path(destination)
         
         # Check if destination is a directory
-        if os.path.isdir(destination):
+        if directory_cache.is_dir(destination_path):
             # If so, we're moving the file into that directory
-            dest_path = os.path.join(destination, os.path.basename(source))
+            dest_path = os.path.join(destination_path, os.path.basename(source))
         else:
             # Otherwise, we're renaming/moving to a new path
-            dest_path = destination
+            dest_path = destination_path
         
         try:
             import shutil
-            shutil.move(source, dest_path)
+            shutil.move(source_path, dest_path)
             return f"Moved {source} to {destination}"
         except Exception as e:
             return f"Error moving {source} to {destination}: {str(e)}"
+        finally:
+            directory_cache.invalidate(source_path)
+            directory_cache.invalidate(destination_path)
     
     def _rename_item(self, old_name: str, new_name: str) -> str:
         old_name = old_name.strip()
         new_name = new_name.strip()
+        old_path = self.terminal.resolve_path(old_name)
+        new_path = self.terminal.resolve_path(new_name)
         
         try:
-            os.rename(old_name, new_name)
+            os.rename(old_path, new_path)
             return f"Renamed {old_name} to {new_name}"
         except Exception as e:
             return f"Error renaming {old_name} to {new_name}: {str(e)}"
+        finally:
+            directory_cache.invalidate(old_path)
+            directory_cache.invalidate(new_path)
     
     def _copy_item(self, source: str, destination: str) -> str:
         source = source.strip()
         destination = destination.strip()
+        source_path = self.terminal.resolve_path(source)
+        destination_path = self.terminal.resolve_path(destination)
         
         try:
             import shutil
-            if os.path.isdir(source):
-                if os.path.exists(destination):
+            if directory_cache.is_dir(source_path):
+                if os.path.exists(destination_path):
                     # If destination exists, copy into it
-                    dest_path = os.path.join(destination, os.path.basename(source))
+                    dest_path = os.path.join(destination_path, os.path.basename(source))
                 else:
                     # Otherwise, create a new directory with that name
-                    dest_path = destination
-                shutil.copytree(source, dest_path)
+                    dest_path = destination_path
+                shutil.copytree(source_path, dest_path)
             else:
-                if os.path.isdir(destination):
+                if directory_cache.is_dir(destination_path):
                     # If destination is a directory, copy into it
-                    dest_path = os.path.join(destination, os.path.basename(source))
+                    dest_path = os.path.join(destination_path, os.path.basename(source))
                 else:
                     # Otherwise, copy to the new path
-                    dest_path = destination
-                shutil.copy2(source, dest_path)
+                    dest_path = destination_path
+                shutil.copy2(source_path, dest_path)
             return f"Copied {source} to {destination}"
         except Exception as e:
             return f"Error copying {source} to {destination}: {str(e)}"
+        finally:
+            # The copy lands at or inside the destination
+            directory_cache.invalidate(destination_path)
     
     def _change_directory(self, directory: str) -> str:
         directory = directory.strip()
@@ -217,10 +315,22 @@ class NLPCommand(Command):
 
 class AutoCompleteCommand(Command):
     """Command for auto-completion functionality"""
+    blocking = False
+    
+    # Completion results remembered per session
+    RECENT_COMPLETIONS = 64
+    
     def __init__(self, terminal):
         super().__init__("autocomplete", "Toggle auto-completion functionality")
         self.terminal = terminal
         self.enabled = False
+        # Sorted command names for prefix lookups, rebuilt when commands change
+        self._command_index: List[str] = []
+        self._indexed_commands = 0
+        # Recent (text, cwd) -> (completions, listing they came from); the web
+        # terminal asks at keystroke rate, from more than one thread
+        self._recent: "OrderedDict[Tuple[str, str], Tuple[List[str], Any]]" = OrderedDict()
+        self._recent_lock = threading.Lock()
     
     def execute(self, args: List[str]) -> str:
         if not args:
@@ -244,22 +354,61 @@ class AutoCompleteCommand(Command):
         """Get possible completions for the given text"""
         if not self.enabled:
             return []
+        return self.complete(text)
+    
+    def complete(self, text: str) -> List[str]:
+        """Completions for text whether or not auto-completion is toggled on
+        
+        Results are remembered per session until the directory they were
+        read from changes, so repeated requests for the same line are cheap.
+        """
+        key = (text, self.terminal.current_dir)
+        with self._recent_lock:
+            recent = self._recent.get(key)
+            if recent is not None:
+                self._recent.move_to_end(key)
+        
+        if recent is not None:
+            completions, listing = recent
+            if listing is None:
+                if self._indexed_commands == len(self.terminal.commands):
+                    return completions
+            else:
+                # The shared cache hands back the same listing until the
+                # directory changes; checking never re-reads the directory
+                if directory_cache.cached(listing[0]) is listing[1]:
+                    return completions
         
+        completions, listing = self._compute_completions(text)
+        if not completions and listing is None:
+            # Nothing found and no listing to check against (a path that
+            # doesn't exist yet, say): cheap to redo, and may change any time
+            return completions
+        with self._recent_lock:
+            self._recent[key] = (completions, listing)
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.RECENT_COMPLETIONS:
+                self._recent.popitem(last=False)
+        return completions
+    
+    def _compute_completions(self, text: str) -> Tuple[List[str], Any]:
+        """Return (completions, (directory path, listing) or None for commands)"""
         # Complete commands
         if not text.strip() or " " not in text:
-            return [cmd for cmd in self.terminal.commands.keys() if cmd.startswith(text)]
+            return self._complete_command(text), None
         
         # Complete file/directory names for relevant commands
         parts = text.split()
         cmd = parts[0]
         
         # Only provide file/directory completion for certain commands
-        if cmd in ["cd", "ls", "cat", "rm", "mkdir", "touch"]:
-            # Get the partial path to complete
-            partial_path = parts[-1] if len(parts) > 1 else ""
+        if cmd in ["cd", "ls", "cat", "tail", "grep", "find", "du", "rm", "mkdir", "touch"]:
+            # Get the partial path to complete; after trailing whitespace
+            # that's a new, empty word
+            partial_path = parts[-1] if len(parts) > 1 and not text[-1].isspace() else ""
             
             # Get the directory to look in
-            if os.path.isdir(partial_path):
+            if partial_path and directory_cache.is_dir(self.terminal.resolve_path(partial_path)):
                 dir_to_check = partial_path
                 partial_name = ""
             else:
@@ -268,18 +417,63 @@ class AutoCompleteCommand(Command):
             
             try:
                 # Get all matching items in the directory
-                items = os.listdir(dir_to_check)
-                matches = [item for item in items if item.startswith(partial_name)]
+                dir_path = self.terminal.resolve_path(dir_to_check)
+                # Huge directories are kept too, or every keystroke in one
+                # would re-read and re-sort it
+                listing = directory_cache.listing(dir_path, keep_oversized=True)
+                matches = listing.with_prefix(partial_name)
                 
                 # Format the completions
                 if dir_to_check == ".":
-                    return matches
+                    return matches, (dir_path, listing)
                 else:
-                    return [os.path.join(os.path.dirname(partial_path), item) for item in matches]
-            except (FileNotFoundError, NotADirectoryError):
-                return []
+                    return [os.path.join(os.path.dirname(partial_path), item) for item in matches], (dir_path, listing)
+            except (FileNotFoundError, NotADirectoryError, PermissionError):
+                return [], None
+        
+        return [], None
+    
+    def _complete_command(self, prefix: str) -> List[str]:
+        """Command names starting with prefix, found by bisecting a sorted index"""
+        if self._indexed_commands != len(self.terminal.commands):
+            self._command_index = sorted(self.terminal.commands)
+            self._indexed_commands = len(self._command_index)
         
-        return []
+        names = self._command_index
+        matches = []
+        i = bisect_left(names, prefix)
+        while i < len(names) and names[i].startswith(prefix):
+            matches.append(names[i])
+            i += 1
+        return matches
+
+class StatsCommand(Command):
+    """Report cache sizes and hit ratios"""
+    blocking = False
+    
+    def __init__(self, terminal):
+        super().__init__("stats", "Show cache sizes and hit ratios")
+        self.terminal = terminal
+    
+    def execute(self, args: List[str]) -> str:
+        intents = self.terminal.commands["nlp"].intent_cache_stats()
+        listings = directory_cache.stats()
+        lines = [
+            f"NLP intent cache: {intents['size']}/{intents['max_size']} queries, "
+            f"{intents['hits']} hits, {intents['misses']} misses ({intents['hit_ratio']:.1%} hit ratio)",
+            f"Directory cache: {listings['directories']} directories, {listings['entries']} entries, "
+            f"{listings['hits']} hits, {listings['misses']} misses ({_ratio(listings['hits'], listings['misses']):.1%} hit ratio)",
+            f"Directory size cache: {len(directory_sizes)} directories, "
+            f"{directory_sizes.hits} hits, {directory_sizes.misses} misses "
+            f"({_ratio(directory_sizes.hits, directory_sizes.misses):.1%} hit ratio)",
+        ]
+        return "\n".join(lines)
+    
+    def help(self) -> str:
+        return "stats: Show cache sizes and hit ratios. Usage: stats"
+
+def _ratio(hits: int, misses: int) -> float:
+    return hits / (hits + misses) if hits + misses else 0.0
 
 class AITerminal(Terminal):
     """Enhanced terminal with natural language processing and auto-completion"""
@@ -289,6 +483,7 @@ class AITerminal(Terminal):
         self.register_command(NLPCommand(self))
         self.autocomplete_command = AutoCompleteCommand(self)
         self.register_command(self.autocomplete_command)
+        self.register_command(StatsCommand(self))
         
         # Command history index for up/down arrow navigation
         self.history_index = len(self.command_history)
@@ -301,10 +496,17 @@ class AITerminal(Terminal):
             import readline
             readline.parse_and_bind("tab: complete")
             
-            # Set up tab completion
+            # Set up tab completion. readline asks for one match per call,
+            # counting state up from 0, so compute the matches once per
+            # line and directory and hand them out from there
+            memo: Dict[str, Any] = {"key": None, "completions": []}
+            
             def completer(text, state):
-                # Get completions from our autocomplete command
-                completions = self.autocomplete_command.get_completions(readline.get_line_buffer())
+                key = (readline.get_line_buffer(), self.current_dir, self.autocomplete_command.enabled)
+                if state == 0 and memo["key"] != key:
+                    memo["key"] = key
+                    memo["completions"] = self.autocomplete_command.get_completions(key[0])
+                completions = memo["completions"]
                 if state < len(completions):
                     return completions[state]
                 else:
@@ -342,18 +544,8 @@ class AITerminal(Terminal):
                 prompt = self.get_prompt()
                 user_input = input(prompt)
                 
-                # Execute the command
-                output = self.execute_command(user_input)
-                
-                # Handle special return values
-                if output == "__EXIT__":
-                    self.running = False
-                    print("Goodbye!")
-                elif output == "__CLEAR__":
-                    # Clear the screen (platform dependent)
-                    os.system('cls' if os.name == 'nt' else 'clear')
-                elif output:
-                    print(output)
+                # Execute the command, printing output as it arrives
+                self.print_output(self.stream_command(user_input))
             
             except KeyboardInterrupt:
                 print("\nUse 'exit' to quit the terminal.")
@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+
+"""Benchmarks for the command dispatch hot path
+
+Runs offline against a synthetic directory tree and a fake process table,
+so results only depend on the code and the machine. Each benchmark reports
+ops/sec and p50/p99 latency; --save stores the results as the baseline and
+later runs compare against it.
+
+    python benchmark.py                 # run and compare with the baseline
+    python benchmark.py --save          # record a new baseline
+    python benchmark.py --check -k nlp  # fail on regressions in nlp benchmarks
+"""
+
+import os
+import sys
+import re
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional
+from unittest import mock
+
+import psutil
+
+from ai_terminal import AITerminal
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmark_baseline.json")
+
+# Size of the synthetic environment
+DIRECTORY_ENTRIES = 1000
+PROCESS_COUNT = 2000
+
+VirtualMemory = namedtuple("VirtualMemory", "total available percent used free")
+SwapMemory = namedtuple("SwapMemory", "total used free percent sin sout")
+Uids = namedtuple("Uids", "real effective saved")
+MemoryInfo = namedtuple("MemoryInfo", "rss vms")
+CpuTimes = namedtuple("CpuTimes", "user system children_user children_system")
+SystemCpuTimes = namedtuple("SystemCpuTimes", "user system idle iowait")
+
+# The user the benchmark runs as; a third of the fake processes are root's
+BENCH_UID = 1000
+
+class FakeProcess:
+    """Stand-in for psutil.Process with fixed, deterministic values"""
+    def __init__(self, pid: int):
+        self.pid = pid
+        self._values = {
+            'pid': pid,
+            'name': f"proc-{pid % 97}",
+            'username': "bench" if pid % 3 else "root",
+            'cpu_percent': (pid * 7919) % 1000 / 10.0,
+            'memory_percent': (pid * 104729) % 1000 / 100.0,
+            'uids': Uids(*[BENCH_UID if pid % 3 else 0] * 3),
+            'ppid': pid // 2,
+            'status': "sleeping",
+            'num_threads': pid % 8 + 1,
+            'memory_info': MemoryInfo((pid * 104729) % 1000 * 1024 * 1024, (pid * 7919) % 4000 * 1024 * 1024),
+            'cpu_times': CpuTimes(pid % 600 / 10.0, pid % 100 / 10.0, 0.0, 0.0),
+            'create_time': 1700000000.0 + pid,
+        }
+        self.info = dict(self._values)
+    
+    def __getattr__(self, name):
+        # Expose values as methods, like psutil.Process.name()
+        if name in self._values:
+            value = self._values[name]
+            method = lambda *args, **kwargs: value
+            # Keep it, so later calls cost what a real method call does
+            setattr(self, name, method)
+            return method
+        raise AttributeError(name)
+    
+    @contextlib.contextmanager
+    def oneshot(self):
+        yield
+
+_processes: List[FakeProcess] = []
+
+def fake_process_iter(attrs=None, ad_value=None):
+    """Yield a fixed process table instead of the host's"""
+    # Like psutil, hand back the same Process objects on every call
+    if not _processes:
+        _processes.extend(FakeProcess(pid) for pid in range(1, PROCESS_COUNT + 1))
+    for proc in _processes:
+        if attrs is not None:
+            # psutil reads the requested attributes up front, in one batch
+            with proc.oneshot():
+                proc.info = {name: proc.pid if name == "pid" else getattr(proc, name)() for name in attrs}
+        yield proc
+
+@contextlib.contextmanager
+def fake_system():
+    """Patch psutil so system commands read a fixed, synthetic host"""
+    gib = 1024 ** 3
+    patches = [
+        mock.patch.object(psutil, "process_iter", fake_process_iter),
+        mock.patch.object(psutil, "cpu_percent", lambda interval=None, percpu=False: 12.5),
+        mock.patch.object(psutil, "cpu_times", lambda percpu=False: SystemCpuTimes(1000.0, 500.0, 8000.0, 100.0)),
+        mock.patch.object(psutil, "virtual_memory", lambda: VirtualMemory(16 * gib, 8 * gib, 50.0, 8 * gib, 6 * gib)),
+        mock.patch.object(psutil, "swap_memory", lambda: SwapMemory(2 * gib, gib // 2, gib + gib // 2, 25.0, 0, 0)),
+        mock.patch.object(os, "getuid", lambda: BENCH_UID),
+    ]
+    with contextlib.ExitStack() as stack:
+        for patch in patches:
+            stack.enter_context(patch)
+        yield
+
+def make_tree(root: str):
+    """Create the synthetic directory the file system benchmarks run in"""
+    for i in range(DIRECTORY_ENTRIES):
+        if i % 10 == 0:
+            os.mkdir(os.path.join(root, f"dir_{i:04d}"))
+        else:
+            with open(os.path.join(root, f"file_{i:04d}.txt"), "w") as f:
+                f.write("x" * (i % 50))
+    with open(os.path.join(root, "big.log"), "w") as f:
+        for i in range(20000):
+            f.write(f"2024-01-01 12:00:{i % 60:02d} {'ERROR' if i % 50 == 0 else 'INFO'} request {i} handled\n")
+    # A long-unmodified directory, as caches only trust settled directories
+    settled = time.time() - 3600
+    os.utime(root, (settled, settled))
+
+def measure(func: Callable[[], object], min_time: float, min_runs: int) -> Dict[str, float]:
+    """Time func repeatedly, returning throughput and latency percentiles"""
+    # Warm caches and lazily created state before timing
+    for _ in range(min(10, min_runs)):
+        func()
+    
+    samples: List[int] = []
+    clock = time.perf_counter_ns
+    deadline = time.perf_counter() + min_time
+    while len(samples) < min_runs or time.perf_counter() < deadline:
+        start = clock()
+        func()
+        samples.append(clock() - start)
+    
+    samples.sort()
+    total = sum(samples)
+    return {
+        'runs': len(samples),
+        'ops_per_sec': round(len(samples) / (total / 1e9), 1),
+        'p50_us': round(samples[len(samples) // 2] / 1000, 2),
+        'p99_us': round(samples[min(len(samples) - 1, int(len(samples) * 0.99))] / 1000, 2),
+    }
+
+def resolve_per_pattern(patterns, query: str):
+    """Reference intent matching: one re.search per pattern, in order"""
+    for pattern, handler in patterns:
+        match = re.search(pattern, query, re.IGNORECASE)
+        if match:
+            return handler, match.groups()
+    return None
+
+def build_benchmarks(terminal: AITerminal) -> Dict[str, Callable[[], object]]:
+    """Return the benchmark cases, keyed by name"""
+    nlp = terminal.commands["nlp"]
+    autocomplete = terminal.autocomplete_command
+    autocomplete.enabled = True
+    
+    return {
+        "parse_command": lambda: terminal.parse_command("ls -la dir_0010/sub"),
+        "parse_pipeline": lambda: terminal.parse_pipeline("cat big.log | cat > /dev/null"),
+        "execute echo": lambda: terminal.execute_command("echo hello world"),
+        "execute unknown": lambda: terminal.execute_command("frobnicate --now"),
+        "execute ls": lambda: terminal.execute_command("ls"),
+        "execute ls -l": lambda: terminal.execute_command("ls -l"),
+        "execute ls page": lambda: terminal.execute_command("ls -t --limit 20 --offset 40"),
+        "execute ls -U page": lambda: terminal.execute_command("ls -U --limit 20"),
+        "execute cat": lambda: terminal.execute_command("cat big.log"),
+        "execute ps": lambda: terminal.execute_command("ps -a"),
+        "execute ps own": lambda: terminal.execute_command("ps"),
+        "execute ps -u sorted": lambda: terminal.execute_command(f"ps -u {BENCH_UID} -o pid,user,rss,time,comm --sort -rss"),
+        "execute top": lambda: terminal.execute_command("top"),
+        "execute top -o mem": lambda: terminal.execute_command("top -o mem -n 20"),
+        "nlp first pattern": lambda: nlp.execute("create a new folder called".split() + ["."]),
+        "nlp last pattern": lambda: nlp.execute("clear the screen".split()),
+        "nlp list directory": lambda: nlp.execute("list contents of the current directory".split()),
+        "nlp unmatched": lambda: nlp.execute("frobnicate the widgets please".split()),
+        # Intent matching alone, against the per-pattern loop it replaced
+        "nlp resolve last": lambda: nlp.resolve("clear the screen"),
+        "nlp resolve last (loop)": lambda: resolve_per_pattern(nlp.command_patterns, "clear the screen"),
+        "nlp resolve unmatched": lambda: nlp.resolve("frobnicate the widgets please"),
+        "nlp resolve unmatched (loop)": lambda: resolve_per_pattern(nlp.command_patterns, "frobnicate the widgets please"),
+        "complete command": lambda: autocomplete.get_completions("h"),
+        "complete path": lambda: autocomplete.get_completions("cat file_01"),
+    }
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]], threshold: float) -> List[str]:
+    """Print results next to the baseline, returning names that regressed"""
+    regressions = []
+    print(f"{'benchmark':30s} {'ops/sec':>12s} {'p50 us':>10s} {'p99 us':>10s} {'vs baseline':>12s}")
+    for name, result in results.items():
+        delta = ""
+        base = baseline.get(name)
+        if base:
+            change = (result['p50_us'] - base['p50_us']) / base['p50_us']
+            delta = f"{change:+.1%}"
+            if change > threshold:
+                regressions.append(name)
+                delta += " !"
+        print(f"{name:30s} {result['ops_per_sec']:12.1f} {result['p50_us']:10.2f} {result['p99_us']:10.2f} {delta:>12s}")
+    return regressions
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the terminal's command dispatch hot path")
+    parser.add_argument("-k", "--filter", default="", help="only run benchmarks whose name contains this text")
+    parser.add_argument("--min-time", type=float, default=0.5, help="minimum seconds to spend on each benchmark")
+    parser.add_argument("--min-runs", type=int, default=50, help="minimum iterations of each benchmark")
+    parser.add_argument("--baseline", default=BASELINE_FILE, help="baseline file to compare with or save to")
+    parser.add_argument("--save", action="store_true", help="store the results as the new baseline")
+    parser.add_argument("--check", action="store_true", help="exit non-zero if p50 regresses beyond the threshold")
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed p50 slowdown before flagging (default 0.25)")
+    args = parser.parse_args(argv)
+    
+    root = tempfile.mkdtemp(prefix="terminal-bench-")
+    try:
+        make_tree(root)
+        with fake_system():
+            terminal = AITerminal()
+            terminal.current_dir = root
+            results = {}
+            for name, func in build_benchmarks(terminal).items():
+                if args.filter in name:
+                    results[name] = measure(func, args.min_time, args.min_runs)
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+    
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+    
+    regressions = compare(results, baseline, args.threshold)
+    
+    if args.save:
+        # Keep baselines for benchmarks that were filtered out of this run
+        baseline.update(results)
+        with open(args.baseline, "w") as f:
+            json.dump({
+                'python': platform.python_version(),
+                'machine': platform.machine(),
+                'results': baseline,
+            }, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"\nBaseline saved to {args.baseline}")
+    
+    if regressions:
+        print(f"\nRegressed beyond {args.threshold:.0%}: {', '.join(regressions)}")
+        if args.check:
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
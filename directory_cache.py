@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+
+import os
+import stat
+import time
+import itertools
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+class Listing:
+    """Names and types of one directory's entries, as of one read"""
+    __slots__ = ("entries", "types", "mtime_ns", "dev", "ino", "checked", "_sorted", "_names")
+    
+    def __init__(self, entries: Tuple[Tuple[str, bool], ...], st: os.stat_result, checked: float):
+        # (name, is_dir) pairs in directory order; is_dir follows symlinks
+        self.entries = entries
+        self.types: Dict[str, bool] = dict(entries)
+        self.mtime_ns = st.st_mtime_ns
+        self.dev = st.st_dev
+        self.ino = st.st_ino
+        # When the directory was last confirmed unchanged (monotonic)
+        self.checked = checked
+        self._sorted: Optional[List[Tuple[bool, str]]] = None
+        self._names: Optional[List[str]] = None
+    
+    def names(self) -> List[str]:
+        return [name for name, _ in self.entries]
+    
+    def with_prefix(self, prefix: str) -> List[str]:
+        """Names starting with prefix, in sorted order, found by bisecting a sorted index"""
+        if self._names is None:
+            self._names = sorted(self.types)
+        names = self._names
+        i = bisect_left(names, prefix)
+        matches = []
+        while i < len(names) and names[i].startswith(prefix):
+            matches.append(names[i])
+            i += 1
+        return matches
+    
+    def dirs_first(self) -> List[Tuple[bool, str]]:
+        """(is_dir, name) pairs, directories first, each sorted by name (computed once)"""
+        if self._sorted is None:
+            dirs = sorted(name for name, is_dir in self.entries if is_dir)
+            files = sorted(name for name, is_dir in self.entries if not is_dir)
+            self._sorted = [(True, name) for name in dirs] + [(False, name) for name in files]
+        return self._sorted
+    
+    def matches(self, st: os.stat_result) -> bool:
+        return (st.st_mtime_ns, st.st_dev, st.st_ino) == (self.mtime_ns, self.dev, self.ino)
+
+class DirectoryCache:
+    """Process-wide, bounded cache of directory listings
+    
+    A listing is reused without any system call for REVALIDATE_AFTER
+    seconds, then re-checked against the directory's mtime (one stat instead
+    of a full read). The terminal's own file operations call invalidate(),
+    so they are seen immediately; changes made by other programs show up
+    after at most REVALIDATE_AFTER seconds.
+    """
+    REVALIDATE_AFTER = 0.1
+    # Directories modified this recently may change again within the same
+    # mtime tick, so their listings are not kept
+    SETTLE_NS = 1_000_000_000
+    # How many directories too large to cache are remembered as such
+    MAX_OVERSIZED = 64
+    # How many of them may still be kept when a caller asks to (completion
+    # in a huge directory would otherwise re-read it on every keystroke)
+    MAX_LARGE_LISTINGS = 2
+    
+    def __init__(self, max_directories: int = 512, max_entries: int = 200000):
+        self.max_directories = max_directories
+        self.max_entries = max_entries
+        # Ordered from least to most recently used
+        self._listings: "OrderedDict[str, Listing]" = OrderedDict()
+        self._total_entries = 0
+        # path -> (mtime_ns, dev, ino) of directories too large to cache
+        self._oversized: "OrderedDict[str, Tuple[int, int, int]]" = OrderedDict()
+        # Oversized listings kept on request, outside the entry bound
+        self._large: "OrderedDict[str, Listing]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def listing(self, path: str, keep_oversized: bool = False) -> Listing:
+        """Return the listing of path, reading it only if it may have changed
+        
+        Directories too large for the cache are read every time, unless
+        keep_oversized is set: then the most recent few are kept aside.
+        Raises the same OSErrors as os.scandir (NotADirectoryError for files).
+        """
+        path = os.path.normpath(path)
+        now = time.monotonic()
+        
+        with self._lock:
+            cached = self._lookup(path)
+            if cached is not None and now - cached.checked < self.REVALIDATE_AFTER:
+                self.hits += 1
+                return cached
+        
+        st = os.stat(path)
+        if not stat.S_ISDIR(st.st_mode):
+            raise NotADirectoryError(20, "Not a directory", path)
+        
+        if cached is not None and cached.matches(st):
+            cached.checked = now
+            with self._lock:
+                self._lookup(path)
+                self.hits += 1
+            return cached
+        
+        listing = Listing(self._read(path), st, now)
+        with self._lock:
+            self.misses += 1
+            self._drop(path)
+            settled = st.st_mtime_ns < time.time_ns() - self.SETTLE_NS
+            if len(listing.entries) > self.max_entries // 4:
+                self._oversized[path] = (st.st_mtime_ns, st.st_dev, st.st_ino)
+                self._oversized.move_to_end(path)
+                if len(self._oversized) > self.MAX_OVERSIZED:
+                    self._oversized.popitem(last=False)
+                if keep_oversized and settled:
+                    self._large[path] = listing
+                    if len(self._large) > self.MAX_LARGE_LISTINGS:
+                        self._large.popitem(last=False)
+            elif settled:
+                self._listings[path] = listing
+                self._total_entries += len(listing.entries)
+                while len(self._listings) > self.max_directories or self._total_entries > self.max_entries:
+                    _, evicted = self._listings.popitem(last=False)
+                    self._total_entries -= len(evicted.entries)
+        return listing
+    
+    def cached(self, path: str) -> Optional[Listing]:
+        """Return path's listing if one is cached and still valid, without ever reading the directory"""
+        path = os.path.normpath(path)
+        now = time.monotonic()
+        with self._lock:
+            cached = self._lookup(path)
+            if cached is None:
+                return None
+            if now - cached.checked < self.REVALIDATE_AFTER:
+                self.hits += 1
+                return cached
+        
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        if not cached.matches(st):
+            return None
+        cached.checked = now
+        with self._lock:
+            self.hits += 1
+        return cached
+    
+    def oversized(self, path: str) -> bool:
+        """Whether path was too large to cache when last read and hasn't changed since"""
+        path = os.path.normpath(path)
+        with self._lock:
+            record = self._oversized.get(path)
+        if record is None:
+            return False
+        try:
+            st = os.stat(path)
+        except OSError:
+            return False
+        return record == (st.st_mtime_ns, st.st_dev, st.st_ino)
+    
+    def is_dir(self, path: str) -> bool:
+        """Like os.path.isdir, answered from the parent's listing when it is cached"""
+        path = os.path.normpath(path)
+        parent, name = os.path.split(path)
+        with self._lock:
+            cached = self._listings.get(parent)
+            if cached is not None and time.monotonic() - cached.checked < self.REVALIDATE_AFTER and name in cached.types:
+                self.hits += 1
+                return cached.types[name]
+        return os.path.isdir(path)
+    
+    def invalidate(self, path: str):
+        """Forget listings affected by a change to path: its ancestors, itself and anything below it"""
+        path = os.path.normpath(path)
+        prefix = path.rstrip(os.sep) + os.sep
+        with self._lock:
+            for key in [key for key in itertools.chain(self._listings, self._large) if key == path or key.startswith(prefix)]:
+                self._drop(key)
+            parent = os.path.dirname(path)
+            while True:
+                self._drop(parent)
+                if os.path.dirname(parent) == parent:
+                    break
+                parent = os.path.dirname(parent)
+    
+    def clear(self):
+        with self._lock:
+            self._listings.clear()
+            self._oversized.clear()
+            self._large.clear()
+            self._total_entries = 0
+    
+    def _lookup(self, path: str) -> Optional[Listing]:
+        """Find a kept listing and mark it recently used (caller holds the lock)"""
+        for listings in (self._listings, self._large):
+            listing = listings.get(path)
+            if listing is not None:
+                listings.move_to_end(path)
+                return listing
+        return None
+    
+    def _drop(self, path: str):
+        """Remove one listing (caller holds the lock)"""
+        self._large.pop(path, None)
+        listing = self._listings.pop(path, None)
+        if listing is not None:
+            self._total_entries -= len(listing.entries)
+    
+    def _read(self, path: str) -> Tuple[Tuple[str, bool], ...]:
+        entries = []
+        with os.scandir(path) as it:
+            for entry in it:
+                try:
+                    is_dir = entry.is_dir()
+                except OSError:
+                    is_dir = False
+                entries.append((entry.name, is_dir))
+        return tuple(entries)
+    
+    def __len__(self) -> int:
+        return len(self._listings)
+    
+    def stats(self) -> Dict[str, int]:
+        return {
+            'directories': len(self._listings),
+            'entries': self._total_entries,
+            'hits': self.hits,
+            'misses': self.misses,
+        }
+
+# Shared by every terminal in the process
+directory_cache = DirectoryCache()
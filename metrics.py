@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+import time
+import threading
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+# Histogram bucket upper bounds, Prometheus style (the +Inf bucket is implied)
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+# Compact shards of finished threads once this many have accumulated
+MAX_SHARDS = 64
+
+class Histogram:
+    """Cumulative-on-render histogram with fixed buckets"""
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+    
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+    
+    def merge(self, other: "Histogram"):
+        for i, count in enumerate(other.counts):
+            self.counts[i] += count
+        self.total += other.total
+
+class CommandStats:
+    """Counters for one command within one shard"""
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.duration = Histogram(LATENCY_BUCKETS)
+        self.output = Histogram(SIZE_BUCKETS)
+    
+    def merge(self, other: "CommandStats"):
+        self.count += other.count
+        self.errors += other.errors
+        self.duration.merge(other.duration)
+        self.output.merge(other.output)
+
+class CommandMetrics:
+    """Per-command counts, errors, latency and output size histograms
+    
+    Each thread records into its own shard, so the hot path takes no locks;
+    shards are only combined when the metrics are rendered.
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        # (thread, shard) pairs; shards of finished threads are folded into _retired
+        self._shards: List[Tuple[threading.Thread, Dict[str, CommandStats]]] = []
+        self._retired: Dict[str, CommandStats] = {}
+    
+    def _shard(self) -> Dict[str, CommandStats]:
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = self._local.shard = {}
+            with self._lock:
+                # Request threads come and go, so don't let dead shards pile up
+                if len(self._shards) >= MAX_SHARDS:
+                    self._compact()
+                self._shards.append((threading.current_thread(), shard))
+        return shard
+    
+    def _compact(self):
+        """Fold shards of finished threads into the retired totals (caller holds the lock)"""
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                _merge_into(self._retired, shard)
+        self._shards = live
+    
+    def record(self, command: str, seconds: float, size: int, error: bool = False):
+        """Record one execution of a command"""
+        shard = self._shard()
+        stats = shard.get(command)
+        if stats is None:
+            stats = shard[command] = CommandStats()
+        stats.count += 1
+        if error:
+            stats.errors += 1
+        stats.duration.observe(seconds)
+        stats.output.observe(size)
+    
+    def instrument(self, command: str, chunks: Iterable[str]) -> Iterator[str]:
+        """Pass chunks through, recording time spent producing them and their size
+        
+        Only the time spent inside the command counts, not the time the
+        consumer takes between chunks (for example, sending them to a browser).
+        """
+        clock = time.perf_counter
+        iterator = iter(chunks)
+        elapsed = 0.0
+        size = 0
+        error = False
+        try:
+            while True:
+                start = clock()
+                try:
+                    chunk = next(iterator)
+                except StopIteration:
+                    elapsed += clock() - start
+                    break
+                elapsed += clock() - start
+                # Non-ASCII text is rare, so only encode when we must
+                size += len(chunk) if chunk.isascii() else len(chunk.encode("utf-8", "replace"))
+                yield chunk
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.record(command, elapsed, size, error)
+    
+    def snapshot(self) -> Dict[str, CommandStats]:
+        """Return totals per command across all threads"""
+        with self._lock:
+            self._compact()
+            totals: Dict[str, CommandStats] = {}
+            _merge_into(totals, self._retired)
+            for _, shard in self._shards:
+                # Copy first: the owning thread may add commands meanwhile
+                _merge_into(totals, dict(shard))
+        return totals
+    
+    def render(self) -> str:
+        """Render the metrics in the Prometheus text exposition format"""
+        totals = self.snapshot()
+        names = sorted(totals)
+        lines = [
+            "# HELP terminal_commands_total Commands executed.",
+            "# TYPE terminal_commands_total counter",
+        ]
+        lines += [f'terminal_commands_total{{command="{_escape(n)}"}} {totals[n].count}' for n in names]
+        lines += [
+            "# HELP terminal_command_errors_total Commands that failed or were not found.",
+            "# TYPE terminal_command_errors_total counter",
+        ]
+        lines += [f'terminal_command_errors_total{{command="{_escape(n)}"}} {totals[n].errors}' for n in names]
+        lines += _render_histogram("terminal_command_duration_seconds", "Time spent executing commands.",
+                                   {n: totals[n].duration for n in names})
+        lines += _render_histogram("terminal_command_output_bytes", "Size of command output.",
+                                   {n: totals[n].output for n in names})
+        return "\n".join(lines) + "\n"
+
+def _merge_into(totals: Dict[str, CommandStats], shard: Dict[str, CommandStats]):
+    for command, stats in shard.items():
+        if command not in totals:
+            totals[command] = CommandStats()
+        totals[command].merge(stats)
+
+def _escape(value: str) -> str:
+    """Escape a label value"""
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_bound(bound: float) -> str:
+    return repr(float(bound)) if isinstance(bound, float) else str(bound)
+
+def _render_histogram(name: str, help_text: str, histograms: Dict[str, Histogram]) -> List[str]:
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for command, histogram in histograms.items():
+        label = f'command="{_escape(command)}"'
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{label},le="{_format_bound(bound)}"}} {cumulative}')
+        cumulative += histogram.counts[-1]
+        lines.append(f'{name}_bucket{{{label},le="+Inf"}} {cumulative}')
+        lines.append(f"{name}_sum{{{label}}} {histogram.total}")
+        lines.append(f"{name}_count{{{label}}} {cumulative}")
+    return lines
+
+# Process-wide registry shared by every terminal
+command_metrics = CommandMetrics()
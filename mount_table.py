@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+import os
+import errno
+import time
+import select
+import threading
+from collections import namedtuple
+from concurrent.futures import Future, wait
+from typing import Dict, List, Optional, Tuple
+
+import psutil
+
+# Space in bytes and inode counts of one mounted file system; the inode
+# figures are 0 where the platform doesn't report them
+MountUsage = namedtuple("MountUsage", "total used free percent inodes inodes_used inodes_free")
+
+# Errors from a mount that is there but not working (a stale NFS handle,
+# a FUSE daemon that died), reported like a mount that doesn't answer
+STALE_ERRORS = {errno.ESTALE, errno.ENOTCONN, errno.EIO}
+
+def read_usage(mountpoint: str) -> MountUsage:
+    """statvfs a mount point, computing the figures the way df does"""
+    if not hasattr(os, "statvfs"):
+        usage = psutil.disk_usage(mountpoint)
+        return MountUsage(usage.total, usage.used, usage.free, usage.percent, 0, 0, 0)
+    
+    st = os.statvfs(mountpoint)
+    total = st.f_blocks * st.f_frsize
+    used = (st.f_blocks - st.f_bfree) * st.f_frsize
+    free = st.f_bavail * st.f_frsize
+    # Percent of the space available to users, as df reports it
+    percent = round(used * 100.0 / (used + free), 1) if used + free else 0.0
+    return MountUsage(total, used, free, percent, st.f_files, st.f_files - st.f_ffree, st.f_ffree)
+
+class MountTable:
+    """Cached list of mounted file systems, probed concurrently with a timeout
+    
+    The partition list is re-read only when the kernel reports a change to
+    /proc/self/mountinfo (POLLPRI/POLLERR), or every REFRESH_AFTER seconds
+    where that isn't available. Each probe runs statvfs on its own daemon
+    thread: a hung network or FUSE mount only costs the caller the timeout,
+    is reported as stale, and is not probed again until its earlier probe
+    returns, so it never ties up more than one thread. Once a probe has been
+    pending for longer than the timeout, later callers report the mount as
+    stale straight away instead of waiting on it again.
+    """
+    MOUNTINFO = "/proc/self/mountinfo"
+    REFRESH_AFTER = 5.0
+    
+    def __init__(self):
+        self._partitions: Optional[list] = None
+        self._read_at = 0.0
+        self._lock = threading.Lock()
+        # Probes that haven't returned yet and when they started, by mount point
+        self._pending: Dict[str, Tuple[Future, float]] = {}
+        self._mountinfo = None
+        self._poller = None
+        self.refreshes = 0
+    
+    def partitions(self) -> list:
+        """psutil.disk_partitions(), re-read only if the mount table may have changed"""
+        with self._lock:
+            if self._partitions is None or self._changed():
+                self._partitions = psutil.disk_partitions(all=False)
+                self._read_at = time.monotonic()
+                self.refreshes += 1
+            return self._partitions
+    
+    def _changed(self) -> bool:
+        """Whether mounts may have changed since the last read (caller holds the lock)"""
+        if self._poller is None and self._mountinfo is None:
+            self._watch()
+        if self._poller is None:
+            return time.monotonic() - self._read_at >= self.REFRESH_AFTER
+        # Polling also re-arms the notification for the next change
+        return any(events & (select.POLLPRI | select.POLLERR) for _, events in self._poller.poll(0))
+    
+    def _watch(self):
+        try:
+            self._mountinfo = open(self.MOUNTINFO, "rb")
+            self._poller = select.poll()
+            self._poller.register(self._mountinfo.fileno(), select.POLLPRI | select.POLLERR)
+        except (OSError, AttributeError):
+            # Not Linux: fall back to refreshing on a timer
+            self._mountinfo = False
+            self._poller = None
+    
+    def probe(self, partitions: list, timeout: float) -> List[Tuple[object, Optional[MountUsage]]]:
+        """Read the usage of each partition concurrently
+        
+        Returns (partition, usage) pairs in the given order. usage is None for
+        stale mounts: those that didn't answer within timeout, are still
+        busy with an earlier probe, or fail with one of STALE_ERRORS.
+        Mounts that can't be read for other reasons (permissions, gone) are
+        left out.
+        """
+        futures: List[Optional[Future]] = []
+        now = time.monotonic()
+        with self._lock:
+            for part in partitions:
+                future, started = self._pending.get(part.mountpoint, (None, 0.0))
+                if future is None or future.done():
+                    future = self._start(part.mountpoint, now)
+                elif now - started >= timeout:
+                    # Already hung for longer than we'd wait: stale
+                    future = None
+                futures.append(future)
+        
+        wait([future for future in futures if future is not None], timeout=timeout)
+        
+        results = []
+        for part, future in zip(partitions, futures):
+            if future is None or not future.done():
+                results.append((part, None))
+                continue
+            try:
+                results.append((part, future.result()))
+            except OSError as e:
+                if e.errno in STALE_ERRORS:
+                    results.append((part, None))
+        return results
+    
+    def _start(self, mountpoint: str, now: float) -> Future:
+        """Run read_usage on a new daemon thread (caller holds the lock)
+        
+        Daemon threads rather than a pool, so a probe stuck in the kernel
+        neither starves other probes nor holds up interpreter exit.
+        """
+        future: Future = Future()
+        
+        def run():
+            try:
+                future.set_result(read_usage(mountpoint))
+            except BaseException as e:
+                future.set_exception(e)
+            finally:
+                with self._lock:
+                    if self._pending.get(mountpoint, (None,))[0] is future:
+                        del self._pending[mountpoint]
+        
+        self._pending[mountpoint] = (future, now)
+        threading.Thread(target=run, name=f"statvfs {mountpoint}", daemon=True).start()
+        return future
+
+# Shared by every terminal in the process
+mount_table = MountTable()
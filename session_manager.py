@@ -0,0 +1,156 @@
+#!/usr/bin/env python3
+
+import sys
+import time
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+
+class Session:
+    """A single terminal session handed out to one browser"""
+    def __init__(self, session_id: str, terminal):
+        self.session_id = session_id
+        self.terminal = terminal
+        self.created = time.monotonic()
+        self.last_access = self.created
+        # Requests from the same browser may overlap; a terminal is not
+        # safe to drive from two threads at once
+        self.lock = threading.Lock()
+    
+    def idle_time(self, now: Optional[float] = None) -> float:
+        """Seconds since the session was last used"""
+        return (now if now is not None else time.monotonic()) - self.last_access
+
+def approximate_size(obj: Any) -> int:
+    """Approximate the memory held by an object graph in bytes"""
+    seen = set()
+    stack = [obj]
+    total = 0
+    
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        
+        # Classes, modules and functions are shared by every session
+        if isinstance(current, (type, type(sys), type(approximate_size), type(len))):
+            continue
+        
+        total += sys.getsizeof(current)
+        
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif hasattr(current, "__dict__"):
+            stack.append(current.__dict__)
+    
+    return total
+
+class SessionManager:
+    """Hand out one terminal per session id, bounded by count and idle time"""
+    def __init__(self, factory: Callable[[], Any], max_sessions: int = 100, idle_timeout: float = 1800.0):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_timeout = idle_timeout
+        # Ordered from least to most recently used
+        self._sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.created = 0
+        self.evicted_idle = 0
+        self.evicted_lru = 0
+    
+    def get(self, session_id: Optional[str]) -> Session:
+        """Return the session for session_id, creating a new one if needed"""
+        now = time.monotonic()
+        
+        with self._lock:
+            self._evict_idle(now)
+            
+            session = self._sessions.get(session_id) if session_id else None
+            if session is not None:
+                session.last_access = now
+                self._sessions.move_to_end(session.session_id)
+                return session
+            
+            # Make room before creating, so we never exceed the cap
+            while self._sessions and len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.evicted_lru += 1
+            
+            session = Session(secrets.token_urlsafe(16), self.factory())
+            self._sessions[session.session_id] = session
+            self.created += 1
+            return session
+    
+    def touch(self, session: Session) -> bool:
+        """Mark a session as used without looking it up, returning whether it is still live"""
+        now = time.monotonic()
+        with self._lock:
+            if self._sessions.get(session.session_id) is not session:
+                return False
+            session.last_access = now
+            self._sessions.move_to_end(session.session_id)
+            return True
+    
+    def remove(self, session_id: str) -> bool:
+        """Drop a session, returning whether it existed"""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+    
+    def _evict_idle(self, now: float):
+        """Drop sessions idle longer than the timeout (caller holds the lock)"""
+        # The least recently used session is first, so stop at the first live one
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if session.idle_time(now) <= self.idle_timeout:
+                break
+            self._sessions.popitem(last=False)
+            self.evicted_idle += 1
+    
+    def __len__(self) -> int:
+        return len(self._sessions)
+    
+    def stats(self, include_sessions: bool = True) -> Dict[str, Any]:
+        """Report session counts, evictions and per-session memory"""
+        now = time.monotonic()
+        
+        with self._lock:
+            self._evict_idle(now)
+            sessions = list(self._sessions.values())
+        
+        result: Dict[str, Any] = {
+            'sessions': len(sessions),
+            'max_sessions': self.max_sessions,
+            'idle_timeout': self.idle_timeout,
+            'created': self.created,
+            'evicted_idle': self.evicted_idle,
+            'evicted_lru': self.evicted_lru,
+        }
+        
+        if include_sessions:
+            details: List[Dict[str, Any]] = []
+            for session in sessions:
+                # Skip sessions busy running a command rather than racing them
+                if not session.lock.acquire(blocking=False):
+                    size = None
+                else:
+                    try:
+                        size = approximate_size(session.terminal)
+                    finally:
+                        session.lock.release()
+                details.append({
+                    # Never echo full session ids, they act as credentials
+                    'id': session.session_id[:8],
+                    'age': round(now - session.created, 1),
+                    'idle': round(session.idle_time(now), 1),
+                    'history': len(session.terminal.command_history),
+                    'memory_bytes': size,
+                })
+            result['total_memory_bytes'] = sum(d['memory_bytes'] or 0 for d in details)
+            result['session_details'] = details
+        
+        return result
@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+
+import time
+import threading
+from collections import namedtuple
+from typing import Any, Dict, List, Optional, Tuple
+
+import psutil
+
+try:
+    import pwd
+except ImportError:
+    # Not available on Windows
+    pwd = None
+
+# One process as of one sample; cpu_percent is measured since the previous
+# sample (100 is one core), cpu_time is total user plus system seconds
+ProcessInfo = namedtuple("ProcessInfo", "pid ppid name owner status threads rss vms cpu_time cpu_percent create_time")
+
+class Snapshot:
+    """Everything one sample saw, with deltas already computed"""
+    __slots__ = ("timestamp", "cpu_percent", "memory", "swap", "processes")
+    
+    def __init__(self, timestamp: float, cpu_percent: float, memory, swap, processes: List[ProcessInfo]):
+        self.timestamp = timestamp
+        self.cpu_percent = cpu_percent
+        self.memory = memory
+        self.swap = swap
+        self.processes = processes
+
+def process_owner(proc) -> Any:
+    """The real uid of a process, or its user name where there are no uids"""
+    return proc.uids().real if pwd is not None else proc.username()
+
+def _busy_and_total(times) -> Tuple[float, float]:
+    total = sum(times)
+    idle = times.idle + getattr(times, "iowait", 0.0)
+    return total - idle, total
+
+class SystemSampler:
+    """Samples CPU, memory, swap and the process table on a background thread
+    
+    Readers get the latest precomputed snapshot without blocking. The thread
+    starts on first use and stops after idle_timeout seconds without
+    readers, dropping its counters; the next read then primes them with two
+    samples PRIME_DELAY apart and restarts it. Only the counters of the
+    latest sample are kept, which is all the deltas need.
+    """
+    # Long enough for CPU deltas to mean something, short enough to wait for
+    PRIME_DELAY = 0.2
+    
+    def __init__(self, interval: float = 1.0, idle_timeout: float = 60.0):
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self._snapshot: Optional[Snapshot] = None
+        # Previous counters: system (busy, total) CPU times and
+        # (pid, create_time) -> process CPU seconds
+        self._cpu_times: Optional[Tuple[float, float]] = None
+        self._process_times: Dict[Tuple[int, float], float] = {}
+        self._sampled_at = 0.0
+        self._last_read = 0.0
+        # Extra pause after slow scans, so sampling a huge process table
+        # doesn't take over a core
+        self._backoff = 0.0
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+    
+    def snapshot(self) -> Snapshot:
+        """Return the latest sample, taking one now only if none is running"""
+        self._last_read = time.monotonic()
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    # Nobody has been sampling, so there are no counters to
+                    # measure from: take two samples close together
+                    self.sample()
+                    time.sleep(self.PRIME_DELAY)
+                    self.sample()
+                    self._thread = threading.Thread(target=self._run, name="system-sampler", daemon=True)
+                    self._thread.start()
+        return self._snapshot
+    
+    def sample(self):
+        """Take one sample and publish it (normally called by the thread)"""
+        now = time.monotonic()
+        elapsed = now - self._sampled_at if self._sampled_at else 0.0
+        
+        busy, total = _busy_and_total(psutil.cpu_times())
+        cpu_percent = 0.0
+        if self._cpu_times is not None and total > self._cpu_times[1]:
+            cpu_percent = max(0.0, min(100.0, (busy - self._cpu_times[0]) * 100.0 / (total - self._cpu_times[1])))
+        self._cpu_times = (busy, total)
+        
+        memory = psutil.virtual_memory()
+        swap = psutil.swap_memory()
+        
+        processes = []
+        process_times = {}
+        previous = self._process_times
+        for proc in psutil.process_iter():
+            try:
+                with proc.oneshot():
+                    times = proc.cpu_times()
+                    cpu_time = times.user + times.system
+                    created = proc.create_time()
+                    # Keyed with the start time, so a reused pid starts afresh
+                    key = (proc.pid, created)
+                    process_times[key] = cpu_time
+                    last = previous.get(key)
+                    percent = (cpu_time - last) * 100.0 / elapsed if last is not None and elapsed > 0 else 0.0
+                    mem = proc.memory_info()
+                    processes.append(ProcessInfo(proc.pid, proc.ppid(), proc.name(), process_owner(proc),
+                                                 proc.status(), proc.num_threads(), mem.rss, mem.vms,
+                                                 cpu_time, max(0.0, percent), created))
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                pass
+        
+        self._process_times = process_times
+        self._sampled_at = now
+        self._snapshot = Snapshot(now, cpu_percent, memory, swap, processes)
+    
+    def _run(self):
+        while time.monotonic() - self._last_read < self.idle_timeout:
+            time.sleep(self.interval + self._backoff)
+            started = time.monotonic()
+            try:
+                self.sample()
+            except Exception:
+                # Keep serving the last good snapshot
+                pass
+            # Keep sampling to about a quarter of a core
+            self._backoff = max(0.0, (time.monotonic() - started) * 3 - self.interval)
+        # Deltas from these would span the whole idle gap
+        with self._lock:
+            self._cpu_times = None
+            self._process_times = {}
+            self._sampled_at = 0.0
+
+# Shared by every terminal in the process
+system_sampler = SystemSampler()
@@ -4,14 +4,366 @@ import os
 import sys
 import shutil
 import platform
-import psutil
 import subprocess
 import datetime
 import re
-from typing import List, Dict, Any, Optional, Callable
+import io
+import codecs
+import locale
+import time
+import select
+import asyncio
+import heapq
+import itertools
+import threading
+import collections
+import fnmatch
+import stat
+import queue
+import math
+import getpass
+import operator
+import ctypes
+import ctypes.util
+import mmap
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import List, Dict, Any, Optional, Callable, Iterable, Iterator, AsyncIterator, Tuple
+
+from metrics import command_metrics
+from directory_cache import directory_cache, Listing
+from system_sampler import system_sampler
+from mount_table import mount_table
+
+try:
+    import pwd
+except ImportError:
+    # Not available on Windows
+    pwd = None
+
+# Streaming commands hand their output over in pieces of roughly this size
+CHUNK_SIZE = 64 * 1024
+
+# Blocking commands run by the async API share one bounded pool per process
+EXECUTOR_WORKERS = min(32, (os.cpu_count() or 1) + 4)
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+
+def get_executor() -> ThreadPoolExecutor:
+    """Return the shared executor for blocking commands, creating it on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(max_workers=EXECUTOR_WORKERS, thread_name_prefix="terminal")
+    return _executor
+
+# Marks the end of a stream when pulling chunks on the executor
+_END_OF_STREAM = object()
+
+# CPU-bound work such as grep over many files is spread over processes
+_process_pool: Optional[ProcessPoolExecutor] = None
+_process_pool_failed = False
+# Pools replaced after a worker died; past the limit, work stays in-process
+_process_pool_breaks = 0
+MAX_PROCESS_POOL_BREAKS = 3
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """Return the shared process pool, or None if processes can't be started here"""
+    global _process_pool, _process_pool_failed
+    if _process_pool is None and not _process_pool_failed:
+        with _executor_lock:
+            if _process_pool is None and not _process_pool_failed:
+                try:
+                    # Forking a multi-threaded server is unsafe, so start
+                    # workers from a clean server process where we can
+                    methods = multiprocessing.get_all_start_methods()
+                    context = multiprocessing.get_context("forkserver" if "forkserver" in methods else None)
+                    _process_pool = ProcessPoolExecutor(max_workers=os.cpu_count() or 1, mp_context=context)
+                except (OSError, NotImplementedError, ValueError):
+                    _process_pool_failed = True
+    return _process_pool
+
+def discard_process_pool(pool: ProcessPoolExecutor):
+    """Drop a pool whose workers died, so the next get_process_pool() starts a new one"""
+    global _process_pool, _process_pool_failed, _process_pool_breaks
+    with _executor_lock:
+        if _process_pool is not pool:
+            # Already replaced by another caller
+            return
+        _process_pool = None
+        _process_pool_breaks += 1
+        if _process_pool_breaks >= MAX_PROCESS_POOL_BREAKS:
+            _process_pool_failed = True
+    pool.shutdown(wait=False)
+
+def join_stream(items: Iterable[str], separator: str, chunk_size: int = CHUNK_SIZE,
+                max_delay: Optional[float] = None) -> Iterator[str]:
+    """Lazily join items with a separator, yielding chunks of about chunk_size
+    
+    With max_delay, the first item is yielded at once and a smaller chunk
+    is also yielded once max_delay seconds have passed since the last one,
+    for producers whose items may be far apart.
+    """
+    batch: List[str] = []
+    size = 0
+    started = False
+    flushed_at = None
+    
+    for item in items:
+        if started:
+            batch.append(separator)
+            size += len(separator)
+        started = True
+        batch.append(item)
+        size += len(item)
+        
+        if size >= chunk_size or (max_delay is not None and
+                                  (flushed_at is None or time.monotonic() - flushed_at >= max_delay)):
+            yield "".join(batch)
+            batch = []
+            size = 0
+            if max_delay is not None:
+                flushed_at = time.monotonic()
+    
+    if batch:
+        yield "".join(batch)
+
+class ScreenFrame(str):
+    """One refresh of a full-screen command such as live top
+    
+    It reads as the frame's plain text, so pipes, redirection and the
+    console need nothing special. Transports that can update a view in
+    place use the header lines and the keyed rows of fields to send only
+    what changed since the previous frame.
+    """
+    def __new__(cls, header: List[str], rows: List[Tuple[str, Tuple[str, ...]]]):
+        lines = header + [" ".join(fields) for _, fields in rows]
+        frame = super().__new__(cls, "\n".join(lines) + "\n")
+        frame.header = header
+        frame.rows = rows
+        return frame
+
+# Pipeline and redirection operators recognised outside quotes
+OPERATORS = ("|", ">>", ">", "<")
+
+def tokenize_command(input_line: str) -> List[Tuple[str, bool]]:
+    """Split a command line into (token, is_operator) pairs
+    
+    Handles single and double quotes, backslash escapes and the |, <, >
+    and >> operators. Raises ValueError on an unterminated quote.
+    """
+    tokens: List[Tuple[str, bool]] = []
+    current: List[str] = []
+    in_word = False
+    # Backslash is the path separator on Windows, so keep it literal there
+    escapes = os.sep != "\\"
+    i = 0
+    n = len(input_line)
+    
+    while i < n:
+        c = input_line[i]
+        if c.isspace() or c in "|<>":
+            if in_word:
+                tokens.append(("".join(current), False))
+                current = []
+                in_word = False
+            if c.isspace():
+                i += 1
+            else:
+                operator = next(op for op in OPERATORS if input_line.startswith(op, i))
+                tokens.append((operator, True))
+                i += len(operator)
+        elif c == "'":
+            end = input_line.find("'", i + 1)
+            if end == -1:
+                raise ValueError("unterminated quote")
+            current.append(input_line[i + 1:end])
+            in_word = True
+            i = end + 1
+        elif c == '"':
+            in_word = True
+            i += 1
+            while i < n and input_line[i] != '"':
+                if escapes and input_line[i] == "\\" and i + 1 < n and input_line[i + 1] in '"\\':
+                    i += 1
+                current.append(input_line[i])
+                i += 1
+            if i >= n:
+                raise ValueError("unterminated quote")
+            i += 1
+        elif escapes and c == "\\" and i + 1 < n:
+            current.append(input_line[i + 1])
+            in_word = True
+            i += 2
+        else:
+            current.append(c)
+            in_word = True
+            i += 1
+    
+    if in_word:
+        tokens.append(("".join(current), False))
+    return tokens
+
+class PipelineStage:
+    """One command of a pipeline, with its redirections"""
+    def __init__(self):
+        self.words: List[str] = []
+        self.input_path: Optional[str] = None
+        self.output_path: Optional[str] = None
+        self.append = False
+    
+    @property
+    def name(self) -> str:
+        return self.words[0]
+    
+    @property
+    def args(self) -> List[str]:
+        return self.words[1:]
+
+def make_decoder(errors: str = 'strict') -> io.IncrementalNewlineDecoder:
+    """Incremental decoder for file contents, translating newlines as text mode would"""
+    decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors)
+    return io.IncrementalNewlineDecoder(decoder, translate=True)
+
+def read_text_chunks(f, decoder: io.IncrementalNewlineDecoder, limit: Optional[int] = None, final: bool = True) -> Iterator[str]:
+    """Read an unbuffered binary file from its current position as text chunks
+    
+    Reads go into one reusable buffer and are decoded incrementally, so
+    memory stays flat however large the file is. At most limit bytes are
+    read; pass final=False to keep a trailing partial character in the
+    decoder for a later call.
+    """
+    buffer = memoryview(bytearray(CHUNK_SIZE))
+    remaining = limit
+    while remaining is None or remaining > 0:
+        view = buffer if remaining is None or remaining >= CHUNK_SIZE else buffer[:remaining]
+        count = f.readinto(view)
+        if not count:
+            break
+        if remaining is not None:
+            remaining -= count
+        text = decoder.decode(view[:count])
+        if text:
+            yield text
+    
+    if final:
+        text = decoder.decode(b"", final=True)
+        if text:
+            yield text
+
+def iter_lines(chunks: Iterable[str]) -> Iterator[str]:
+    """Split a stream of text chunks into lines, keeping their newlines"""
+    pending = ""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        lines = (pending + chunk).split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+    if pending:
+        yield pending
+
+def iter_line_batches(chunks: Iterable[str]) -> Iterator[List[str]]:
+    """Split a stream of text chunks into the complete lines of each chunk
+    
+    Lines are given without their newlines, one list per chunk, so callers
+    can answer as soon as a chunk arrives. An empty chunk (an idle
+    heartbeat) gives an empty list.
+    """
+    pending = ""
+    for chunk in chunks:
+        if not chunk:
+            yield []
+            continue
+        lines = (pending + chunk).split("\n")
+        pending = lines.pop()
+        yield lines
+    if pending:
+        yield [pending]
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = getattr(os, "O_CLOEXEC", 0o2000000)
+
+_libc = None
+
+def _inotify_libc():
+    """Load libc for inotify, or return None where it is unavailable"""
+    global _libc
+    if _libc is None:
+        _libc = False
+        if sys.platform.startswith("linux"):
+            try:
+                libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+                libc.inotify_init1
+                libc.inotify_add_watch
+                _libc = libc
+            except (OSError, AttributeError):
+                pass
+    return _libc or None
+
+class FileWatcher:
+    """Wait for a file to change, using inotify where available and polling otherwise"""
+    def __init__(self, path: str, poll_interval: float = 0.5):
+        self.poll_interval = poll_interval
+        self._fd: Optional[int] = None
+        
+        libc = _inotify_libc()
+        if libc is not None:
+            fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+            if fd >= 0:
+                mask = IN_MODIFY | IN_ATTRIB | IN_DELETE_SELF | IN_MOVE_SELF
+                if libc.inotify_add_watch(fd, os.fsencode(path), mask) >= 0:
+                    self._fd = fd
+                else:
+                    # Watch limit reached or unsupported filesystem: poll instead
+                    os.close(fd)
+    
+    @property
+    def uses_inotify(self) -> bool:
+        return self._fd is not None
+    
+    def wait(self, timeout: float) -> bool:
+        """Block until the file may have changed or timeout passes
+        
+        Returns False only when it is known that nothing changed; when
+        polling, the caller has to check the file itself.
+        """
+        if self._fd is None:
+            time.sleep(min(timeout, self.poll_interval))
+            return True
+        
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return False
+        # Only the fact that something happened matters, not the events
+        try:
+            while os.read(self._fd, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        return True
+    
+    def close(self):
+        if self._fd is not None:
+            os.close(self._fd)
+            self._fd = None
 
 class Command:
     """Base class for all terminal commands"""
+    # Whether the command may block on I/O or sleep; the async API runs
+    # blocking commands on the executor and the rest inline
+    blocking = True
+    # Whether stream() consumes the output of the previous pipeline stage
+    reads_stdin = False
+    
     def __init__(self, name: str, description: str):
         self.name = name
         self.description = description
@@ -19,6 +371,24 @@ class Command:
     def execute(self, args: List[str]) -> str:
         """Execute the command with the given arguments"""
         raise NotImplementedError("Subclasses must implement execute()")
+    
+    def stream(self, args: List[str], stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        """Execute the command, yielding its output in chunks as it is produced
+        
+        Commands with potentially large output override this and implement
+        execute() by joining the chunks; everything else yields its whole
+        output at once. Commands with reads_stdin set are given the previous
+        pipeline stage's output as an iterator of chunks. Commands that run
+        until cancelled yield an empty chunk while idle, so consumers get a
+        chance to stop them.
+        """
+        output = self.execute(args)
+        if output:
+            yield output
+    
+    def runs_until_cancelled(self, args: List[str]) -> bool:
+        """Whether the command keeps producing output until it is cancelled"""
+        return False
 
     def help(self) -> str:
         """Return help information for the command"""
@@ -26,98 +396,257 @@ class Command:
 
 class FileSystemCommand(Command):
     """Base class for file system related commands"""
-    def __init__(self, name: str, description: str):
+    def __init__(self, name: str, description: str, terminal):
         super().__init__(name, description)
+        # Paths are resolved against the terminal's own working directory,
+        # never the process cwd, so several terminals can share a process
+        self.terminal = terminal
 
 class PwdCommand(FileSystemCommand):
     """Print working directory command"""
-    def __init__(self):
-        super().__init__("pwd", "Print the current working directory")
+    blocking = False
+    
+    def __init__(self, terminal):
+        super().__init__("pwd", "Print the current working directory", terminal)
     
     def execute(self, args: List[str]) -> str:
-        return os.getcwd()
+        return self.terminal.current_dir
 
 class LsCommand(FileSystemCommand):
     """List directory contents command"""
-    def __init__(self):
-        super().__init__("ls", "List directory contents")
+    def __init__(self, terminal):
+        super().__init__("ls", "List directory contents", terminal)
     
     def execute(self, args: List[str]) -> str:
+        return "".join(self.stream(args))
+    
+    def stream(self, args: List[str], stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
         # Parse arguments
-        show_hidden = "-a" in args or "--all" in args
-        long_format = "-l" in args
+        try:
+            options, operands = self._parse_args(args)
+        except ValueError as e:
+            yield f"ls: {e}"
+            return
+        
+        show_hidden = options["all"]
+        long_format = options["long"]
+        offset = options["offset"]
+        limit = options["limit"]
         
         # Determine target directory
-        target_dir = "."
-        for arg in args:
-            if not arg.startswith("-"):
-                target_dir = arg
-                break
+        target_dir = operands[0] if operands else "."
+        dir_path = self.terminal.resolve_path(target_dir)
+        
+        if not (long_format or options["time"] or options["unsorted"]):
+            # Names and types alone come from the shared listing cache when
+            # it already has them. Otherwise a page (--limit) is cheaper to
+            # pick with the bounded heap below, and so is a directory too
+            # large to be cached at all
+            listing = directory_cache.cached(dir_path)
+            if listing is not None or (limit is None and not directory_cache.oversized(dir_path)):
+                yield from self._stream_cached(target_dir, dir_path, show_hidden, offset, limit, listing)
+                return
         
         try:
-            items = os.listdir(target_dir)
-            
-            # Filter hidden files if not showing all
-            if not show_hidden:
-                items = [item for item in items if not item.startswith(".")]
+            # scandir hands back each entry's type from the directory read
+            # itself, so partitioning costs no extra syscalls
+            it = os.scandir(dir_path)
+        except FileNotFoundError:
+            yield f"ls: cannot access '{target_dir}': No such file or directory"
+            return
+        except NotADirectoryError:
+            # Like ls, list a file operand as itself
+            yield from self._list_file(target_dir, dir_path, long_format)
+            return
+        except PermissionError:
+            yield f"ls: cannot open directory '{target_dir}': Permission denied"
+            return
+        
+        separator = "\n" if long_format else "  "
+        stop = offset + limit if limit is not None else None
+        
+        with it:
+            # Pair each entry with its type, checked once
+            entries = ((self._is_dir(entry), entry) for entry in it if show_hidden or not entry.name.startswith("."))
             
-            # Sort items (directories first, then files)
-            dirs = []
-            files = []
-            for item in items:
-                full_path = os.path.join(target_dir, item)
-                if os.path.isdir(full_path):
-                    dirs.append(item)
-                else:
-                    files.append(item)
+            if options["unsorted"]:
+                # Directory order: stream straight from the directory read,
+                # and stop reading once the page is full
+                yield from join_stream(self._format_entries(itertools.islice(entries, offset, stop), long_format), separator)
+                return
             
-            dirs.sort()
-            files.sort()
-            sorted_items = dirs + files
+            if options["time"]:
+                # Newest first, ties by name
+                key = lambda item: (-self._mtime(item[1]), item[1].name)
+            else:
+                # Directories first, then files, each by name
+                key = lambda item: (not item[0], item[1].name)
             
-            if long_format:
-                result = []
-                for item in sorted_items:
-                    full_path = os.path.join(target_dir, item)
-                    stats = os.stat(full_path)
-                    # Format: permissions size last_modified name
-                    file_type = "d" if os.path.isdir(full_path) else "-"
-                    size = stats.st_size
-                    mod_time = datetime.datetime.fromtimestamp(stats.st_mtime).strftime("%b %d %H:%M")
-                    result.append(f"{file_type} {size:8d} {mod_time} {item}{'/' if os.path.isdir(full_path) else ''}")
-                return "\n".join(result)
+            if stop is not None:
+                # Only the first offset+limit entries matter, so keep a bounded
+                # heap instead of sorting the whole directory
+                selected = heapq.nsmallest(stop, entries, key=key)[offset:]
+            elif options["time"]:
+                selected = sorted(entries, key=key)[offset:]
             else:
-                # Add trailing slash to directories
-                formatted_items = [f"{item}/" if os.path.isdir(os.path.join(target_dir, item)) else item for item in sorted_items]
-                return "  ".join(formatted_items)
+                # Partitioning and sorting by name alone is cheaper than a tuple key
+                dirs = []
+                files = []
+                for item in entries:
+                    (dirs if item[0] else files).append(item)
+                by_name = lambda item: item[1].name
+                dirs.sort(key=by_name)
+                files.sort(key=by_name)
+                selected = (dirs + files)[offset:]
+        
+        yield from join_stream(self._format_entries(selected, long_format), separator)
+    
+    def _stream_cached(self, target_dir: str, dir_path: str, show_hidden: bool, offset: int, limit: Optional[int],
+                       listing: Optional[Listing] = None) -> Iterator[str]:
+        """List names, directories first, from the shared directory cache"""
+        try:
+            if listing is None:
+                listing = directory_cache.listing(dir_path)
         except FileNotFoundError:
-            return f"ls: cannot access '{target_dir}': No such file or directory"
+            yield f"ls: cannot access '{target_dir}': No such file or directory"
+            return
+        except NotADirectoryError:
+            yield from self._list_file(target_dir, dir_path, False)
+            return
         except PermissionError:
-            return f"ls: cannot open directory '{target_dir}': Permission denied"
+            yield f"ls: cannot open directory '{target_dir}': Permission denied"
+            return
+        
+        entries = ((is_dir, name) for is_dir, name in listing.dirs_first() if show_hidden or not name.startswith("."))
+        stop = offset + limit if limit is not None else None
+        names = (f"{name}/" if is_dir else name for is_dir, name in itertools.islice(entries, offset, stop))
+        yield from join_stream(names, "  ")
+    
+    def _parse_args(self, args: List[str]) -> Tuple[Dict[str, Any], List[str]]:
+        """Split arguments into options and operands, raising ValueError on bad usage"""
+        options: Dict[str, Any] = {"all": False, "long": False, "unsorted": False, "time": False, "offset": 0, "limit": None}
+        flags = {"a": "all", "l": "long", "U": "unsorted", "t": "time"}
+        operands = []
+        
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            i += 1
+            name, has_value, value = arg.partition("=")
+            if name in ("--limit", "--offset"):
+                if not has_value:
+                    if i >= len(args):
+                        raise ValueError(f"option '{name}' requires an argument")
+                    value = args[i]
+                    i += 1
+                if not value.isdigit():
+                    raise ValueError(f"invalid {name} value: '{value}'")
+                options[name[2:]] = int(value)
+            elif arg == "--all":
+                options["all"] = True
+            elif arg.startswith("-") and len(arg) > 1 and not arg.startswith("--"):
+                # Short flags may be combined, as in -la
+                for flag in arg[1:]:
+                    if flag not in flags:
+                        raise ValueError(f"invalid option -- '{flag}'")
+                    options[flags[flag]] = True
+            elif arg.startswith("--"):
+                raise ValueError(f"unrecognized option '{arg}'")
+            else:
+                operands.append(arg)
+        
+        return options, operands
+    
+    def _is_dir(self, entry: os.DirEntry) -> bool:
+        """Like os.path.isdir, but using the type cached on the entry"""
+        try:
+            return entry.is_dir()
+        except OSError:
+            return False
+    
+    def _stat(self, entry: os.DirEntry) -> os.stat_result:
+        """Stat an entry once (the result is cached on the DirEntry)"""
+        try:
+            return entry.stat()
+        except OSError:
+            # Dangling symlink: describe the link itself
+            return entry.stat(follow_symlinks=False)
+    
+    def _mtime(self, entry: os.DirEntry) -> float:
+        try:
+            return self._stat(entry).st_mtime
+        except OSError:
+            return 0.0
+    
+    def _format_entries(self, entries: Iterable[Tuple[bool, os.DirEntry]], long_format: bool) -> Iterator[str]:
+        """Format (is_dir, entry) pairs one at a time"""
+        # Many entries share a modification minute, so format each minute once
+        times: Dict[int, str] = {}
+        for is_dir, entry in entries:
+            if not long_format:
+                # Add trailing slash to directories
+                yield f"{entry.name}/" if is_dir else entry.name
+                continue
+            try:
+                stats = self._stat(entry)
+            except OSError as e:
+                yield f"ls: cannot access '{entry.name}': {e.strerror}"
+                continue
+            yield self._format_long(entry.name, is_dir, stats, times)
+    
+    def _format_long(self, name: str, is_dir: bool, stats: os.stat_result, times: Dict[int, str]) -> str:
+        """Format one long listing line"""
+        minute = int(stats.st_mtime) // 60
+        mod_time = times.get(minute)
+        if mod_time is None:
+            mod_time = times[minute] = datetime.datetime.fromtimestamp(stats.st_mtime).strftime("%b %d %H:%M")
+        # Format: permissions size last_modified name
+        file_type = "d" if is_dir else "-"
+        return f"{file_type} {stats.st_size:8d} {mod_time} {name}{'/' if is_dir else ''}"
+    
+    def _list_file(self, target: str, path: str, long_format: bool) -> Iterator[str]:
+        """List a single file operand"""
+        # The operand may not exist at all (as with f.txt/x)
+        try:
+            link_stats = os.lstat(path)
+        except OSError as e:
+            yield f"ls: cannot access '{target}': {e.strerror}"
+            return
+        if not long_format:
+            yield target
+            return
+        try:
+            stats = os.stat(path)
+        except OSError:
+            # Dangling symlink: describe the link itself
+            stats = link_stats
+        yield self._format_long(target, False, stats, {})
 
 class CdCommand(FileSystemCommand):
     """Change directory command"""
-    def __init__(self):
-        super().__init__("cd", "Change the current working directory")
+    def __init__(self, terminal):
+        super().__init__("cd", "Change the current working directory", terminal)
     
     def execute(self, args: List[str]) -> str:
         # Default to home directory if no args
         target_dir = os.path.expanduser("~") if not args else args[0]
+        new_dir = os.path.normpath(self.terminal.resolve_path(target_dir))
         
-        try:
-            os.chdir(target_dir)
-            return ""  # cd typically doesn't output anything on success
-        except FileNotFoundError:
+        # Validate the way chdir would, but only update this terminal's cwd
+        if not os.path.exists(new_dir):
             return f"cd: {target_dir}: No such file or directory"
-        except NotADirectoryError:
+        if not os.path.isdir(new_dir):
             return f"cd: {target_dir}: Not a directory"
-        except PermissionError:
+        if not os.access(new_dir, os.X_OK):
             return f"cd: {target_dir}: Permission denied"
+        
+        self.terminal.current_dir = new_dir
+        return ""  # cd typically doesn't output anything on success
 
 class MkdirCommand(FileSystemCommand):
     """Make directory command"""
-    def __init__(self):
-        super().__init__("mkdir", "Create new directories")
+    def __init__(self, terminal):
+        super().__init__("mkdir", "Create new directories", terminal)
     
     def execute(self, args: List[str]) -> str:
         if not args:
@@ -129,24 +658,26 @@ class MkdirCommand(FileSystemCommand):
         
         errors = []
         for path in args:
+            full_path = self.terminal.resolve_path(path)
             try:
                 if create_parents:
-                    os.makedirs(path, exist_ok=True)
+                    os.makedirs(full_path, exist_ok=True)
                 else:
-                    os.mkdir(path)
+                    os.mkdir(full_path)
             except FileExistsError:
                 errors.append(f"mkdir: cannot create directory '{path}': File exists")
             except FileNotFoundError:
                 errors.append(f"mkdir: cannot create directory '{path}': No such file or directory")
             except PermissionError:
                 errors.append(f"mkdir: cannot create directory '{path}': Permission denied")
+            directory_cache.invalidate(full_path)
         
         return "\n".join(errors) if errors else ""
 
 class RmCommand(FileSystemCommand):
     """Remove files or directories command"""
-    def __init__(self):
-        super().__init__("rm", "Remove files or directories")
+    def __init__(self, terminal):
+        super().__init__("rm", "Remove files or directories", terminal)
     
     def execute(self, args: List[str]) -> str:
         if not args:
@@ -160,14 +691,15 @@ class RmCommand(FileSystemCommand):
         
         errors = []
         for path in paths:
+            full_path = self.terminal.resolve_path(path)
             try:
-                if os.path.isdir(path):
+                if os.path.isdir(full_path):
                     if recursive:
-                        shutil.rmtree(path)
+                        shutil.rmtree(full_path)
                     else:
                         errors.append(f"rm: cannot remove '{path}': Is a directory")
                 else:
-                    os.remove(path)
+                    os.remove(full_path)
             except FileNotFoundError:
                 if not force:
                     errors.append(f"rm: cannot remove '{path}': No such file or directory")
@@ -175,13 +707,14 @@ class RmCommand(FileSystemCommand):
                 errors.append(f"rm: cannot remove '{path}': Permission denied")
             except Exception as e:
                 errors.append(f"rm: cannot remove '{path}': {str(e)}")
+            directory_cache.invalidate(full_path)
         
         return "\n".join(errors) if errors else ""
 
 class TouchCommand(FileSystemCommand):
     """Create empty files or update timestamps command"""
-    def __init__(self):
-        super().__init__("touch", "Create empty files or update file timestamps")
+    def __init__(self, terminal):
+        super().__init__("touch", "Create empty files or update file timestamps", terminal)
     
     def execute(self, args: List[str]) -> str:
         if not args:
@@ -189,10 +722,11 @@ class TouchCommand(FileSystemCommand):
         
         errors = []
         for path in args:
+            full_path = self.terminal.resolve_path(path)
             try:
                 # If file exists, update timestamp; otherwise create it
-                with open(path, 'a'):
-                    os.utime(path, None)
+                with open(full_path, 'a'):
+                    os.utime(full_path, None)
             except FileNotFoundError:
                 # This might happen if parent directory doesn't exist
                 errors.append(f"touch: cannot touch '{path}': No such file or directory")
@@ -200,39 +734,1262 @@ class TouchCommand(FileSystemCommand):
                 errors.append(f"touch: cannot touch '{path}': Permission denied")
             except Exception as e:
                 errors.append(f"touch: {str(e)}")
+            directory_cache.invalidate(full_path)
         
         return "\n".join(errors) if errors else ""
 
 class CatCommand(FileSystemCommand):
     """Concatenate and print files command"""
-    def __init__(self):
-        super().__init__("cat", "Concatenate and print files")
+    reads_stdin = True
+    
+    def __init__(self, terminal):
+        super().__init__("cat", "Concatenate and print files", terminal)
     
     def execute(self, args: List[str]) -> str:
-        if not args:
-            return "cat: missing file operand"
+        return "".join(self.stream(args))
+    
+    def stream(self, args: List[str], stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        # Parse arguments
+        byte_range = None
+        paths = []
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            i += 1
+            if arg == "--bytes" or arg.startswith("--bytes="):
+                if arg == "--bytes":
+                    if i >= len(args):
+                        yield "cat: option '--bytes' requires an argument"
+                        return
+                    spec = args[i]
+                    i += 1
+                else:
+                    spec = arg[len("--bytes="):]
+                byte_range = self._parse_range(spec)
+                if byte_range is None:
+                    yield f"cat: invalid byte range: '{spec}'"
+                    return
+            else:
+                paths.append(arg)
         
-        results = []
-        for path in args:
+        # With no files, copy standard input through
+        if not paths and stdin is not None:
+            paths = ["-"]
+        
+        if not paths:
+            yield "cat: missing file operand"
+            return
+        
+        for index, path in enumerate(paths):
+            # Files are separated by a newline, as when joining whole contents
+            if index:
+                yield "\n"
+            if path == "-" and stdin is not None:
+                yield from stdin
+                continue
             try:
-                with open(path, 'r') as f:
-                    content = f.read()
-                    results.append(content)
+                yield from self._read_chunks(self.terminal.resolve_path(path), byte_range)
             except FileNotFoundError:
-                results.append(f"cat: {path}: No such file or directory")
+                yield f"cat: {path}: No such file or directory"
             except IsADirectoryError:
-                results.append(f"cat: {path}: Is a directory")
+                yield f"cat: {path}: Is a directory"
             except PermissionError:
-                results.append(f"cat: {path}: Permission denied")
+                yield f"cat: {path}: Permission denied"
             except UnicodeDecodeError:
-                results.append(f"cat: {path}: Binary file")
+                yield f"cat: {path}: Binary file"
+            except Exception as e:
+                yield f"cat: {path}: {str(e)}"
+    
+    def _parse_range(self, spec: str) -> Optional[Tuple[int, Optional[int]]]:
+        """Parse START-END (END inclusive), START- or -COUNT (the last COUNT bytes)
+        
+        Returns (start, end) with end exclusive; a suffix range is returned
+        as a negative start. Returns None if the range is invalid.
+        """
+        start, dash, end = spec.partition("-")
+        if not dash or (start and not start.isdigit()) or (end and not end.isdigit()):
+            return None
+        if not start:
+            return (-int(end), None) if end else None
+        if end and int(end) < int(start):
+            return None
+        return int(start), int(end) + 1 if end else None
+    
+    def _read_chunks(self, path: str, byte_range: Optional[Tuple[int, Optional[int]]] = None) -> Iterator[str]:
+        """Stream a file (or a byte range of it) as text in fixed-size chunks"""
+        with open(path, 'rb', buffering=0) as f:
+            fd = f.fileno()
+            start, stop = 0, None
+            if byte_range is not None:
+                start, stop = byte_range
+                if start < 0:
+                    start = max(0, os.fstat(fd).st_size + start)
+                f.seek(start)
+            
+            # Tell the kernel to read ahead aggressively
+            if hasattr(os, "posix_fadvise"):
+                try:
+                    os.posix_fadvise(fd, start, 0, os.POSIX_FADV_SEQUENTIAL)
+                except OSError:
+                    pass
+            
+            # A range may start or end inside a multi-byte character, so only
+            # whole files are strict about decoding (and thus detect binaries)
+            decoder = make_decoder('strict' if byte_range is None else 'replace')
+            yield from read_text_chunks(f, decoder, stop - start if stop is not None else None)
+
+class TailCommand(FileSystemCommand):
+    """Output the last part of files, optionally following appended data"""
+    reads_stdin = True
+    
+    # How often an idle follow loop yields, so it can be cancelled
+    HEARTBEAT_INTERVAL = 1.0
+    # Size of the blocks read backwards when looking for the last lines
+    BLOCK_SIZE = 8192
+    
+    def __init__(self, terminal):
+        super().__init__("tail", "Output the last part of files", terminal)
+    
+    def execute(self, args: List[str]) -> str:
+        return "".join(self.stream(args))
+    
+    def help(self) -> str:
+        return "tail: Output the last part of files. Usage: tail [-n N] [-f] [FILE...]"
+    
+    def runs_until_cancelled(self, args: List[str]) -> bool:
+        try:
+            return self._parse_args(args)[1]
+        except ValueError:
+            return False
+    
+    def _parse_args(self, args: List[str]) -> Tuple[int, bool, List[str]]:
+        """Return (lines, follow, paths), raising ValueError on bad usage"""
+        lines = 10
+        follow = False
+        paths = []
+        
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            i += 1
+            value = None
+            if arg in ("-f", "--follow"):
+                follow = True
+            elif arg == "-n":
+                if i >= len(args):
+                    raise ValueError("option requires an argument -- 'n'")
+                value = args[i]
+                i += 1
+            elif arg.startswith("-n"):
+                value = arg[2:]
+            elif arg.startswith("--lines="):
+                value = arg[len("--lines="):]
+            elif arg.startswith("-") and arg[1:].isdigit():
+                value = arg[1:]
+            elif arg.startswith("-") and arg != "-":
+                raise ValueError(f"invalid option -- '{arg.lstrip('-')}'")
+            else:
+                paths.append(arg)
+            
+            if value is not None:
+                if not value.isdigit():
+                    raise ValueError(f"invalid number of lines: '{value}'")
+                lines = int(value)
+        
+        return lines, follow, paths
+    
+    def stream(self, args: List[str], stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        try:
+            lines, follow, paths = self._parse_args(args)
+        except ValueError as e:
+            yield f"tail: {e}"
+            return
+        
+        if not paths:
+            if stdin is None:
+                yield "tail: missing file operand"
+                return
+            # Standard input can't be read backwards, so keep a window of lines
+            if lines:
+                yield from join_stream(collections.deque(iter_lines(stdin), maxlen=lines), "")
+            else:
+                for _ in stdin:
+                    pass
+            return
+        
+        if follow and len(paths) > 1:
+            yield "tail: follow mode supports a single file"
+            return
+        
+        for index, path in enumerate(paths):
+            # Label each file when there are several, as tail does
+            if len(paths) > 1:
+                if index:
+                    yield "\n"
+                yield f"==> {path} <==\n"
+            try:
+                yield from self._tail_file(self.terminal.resolve_path(path), lines, follow)
+            except FileNotFoundError:
+                yield f"tail: cannot open '{path}' for reading: No such file or directory"
+            except IsADirectoryError:
+                yield f"tail: error reading '{path}': Is a directory"
+            except PermissionError:
+                yield f"tail: cannot open '{path}' for reading: Permission denied"
+            except OSError as e:
+                yield f"tail: {path}: {e.strerror}"
+    
+    def _tail_file(self, path: str, lines: int, follow: bool) -> Iterator[str]:
+        """Yield the last lines of a file, then (if following) whatever is appended"""
+        with open(path, 'rb', buffering=0) as f:
+            # Watch before the first read, so no change after it goes unseen
+            watcher = FileWatcher(path) if follow else None
+            try:
+                size = os.fstat(f.fileno()).st_size
+                f.seek(self._find_start(f, size, lines))
+                # Lines may contain anything, so never fail halfway through a follow
+                decoder = make_decoder('replace')
+                yield from read_text_chunks(f, decoder, final=not follow)
+                
+                if follow:
+                    yield from self._follow(f, watcher, decoder)
+            finally:
+                if watcher is not None:
+                    watcher.close()
+    
+    def _find_start(self, f, size: int, lines: int) -> int:
+        """Find the offset of the last lines by reading backwards from the end"""
+        if lines == 0:
+            return size
+        
+        # A trailing newline ends the last line rather than starting a new one
+        pos = size
+        if size:
+            f.seek(size - 1)
+            if f.read(1) == b"\n":
+                pos -= 1
+        
+        remaining = lines
+        while pos > 0:
+            read_size = min(self.BLOCK_SIZE, pos)
+            pos -= read_size
+            f.seek(pos)
+            block = f.read(read_size)
+            index = len(block)
+            while True:
+                index = block.rfind(b"\n", 0, index)
+                if index == -1:
+                    break
+                remaining -= 1
+                if remaining == 0:
+                    return pos + index + 1
+        return 0
+    
+    def _follow(self, f, watcher: FileWatcher, decoder: io.IncrementalNewlineDecoder) -> Iterator[str]:
+        """Yield data appended to an open file until the consumer stops"""
+        while True:
+            watcher.wait(self.HEARTBEAT_INTERVAL)
+            position = f.tell()
+            size = os.fstat(f.fileno()).st_size
+            
+            if size < position:
+                # Truncated (for example by log rotation with copytruncate)
+                yield "tail: file truncated\n"
+                f.seek(0)
+                position = 0
+            
+            # Checked whatever the watcher says: events that arrived while
+            # the consumer was busy were drained by an earlier wait
+            if size > position:
+                # Only the appended bytes are read, whatever the file size
+                yield from read_text_chunks(f, decoder, final=False)
+            else:
+                yield ""
+
+# Files at least this large are searched in the process pool
+GREP_POOL_MIN_SIZE = 256 * 1024
+# Bytes examined for NUL when deciding whether a file is binary
+GREP_BINARY_PROBE = 8192
+
+def _count_newlines(buf, start: int, end: int) -> int:
+    """Count newlines in buf[start:end] without copying more than a window at a time"""
+    count = 0
+    while start < end:
+        stop = min(end, start + CHUNK_SIZE * 16)
+        count += buf[start:stop].count(b"\n")
+        start = stop
+    return count
+
+def grep_buffer(buf, regex, max_count: Optional[int] = None, line_numbers: bool = False) -> Iterator[Tuple[int, bytes]]:
+    """Yield (line number, line) for each line of buf that regex matches
+    
+    buf may be bytes or an mmap; the whole buffer is searched with one
+    compiled pattern instead of line by line. Line numbers are only counted
+    when asked for (otherwise they are 0). A final newline ends the last
+    line rather than starting an empty one:
+    
+    >>> [line for _, line in grep_buffer(b"a\\nb\\n", re.compile(b"^", re.M))]
+    [b'a', b'b']
+    >>> [line for _, line in grep_buffer(b"a\\n\\n", re.compile(b"^$", re.M))]
+    [b'']
+    """
+    pos = 0
+    counted_to = 0
+    line_number = 0
+    found = 0
+    size = len(buf)
+    
+    while pos < size and (max_count is None or found < max_count):
+        match = regex.search(buf, pos)
+        if match is None:
+            break
+        start = match.start()
+        # An empty match just past the final newline is not a line
+        if start == size and buf[size - 1:size] == b"\n":
+            break
+        line_start = buf.rfind(b"\n", max(pos - 1, 0), start) + 1
+        line_end = buf.find(b"\n", start)
+        if line_end == -1:
+            line_end = size
+        
+        # A match may run past the end of its line (e.g. via \s); only
+        # count the line if the pattern also matches within it
+        if match.end() > line_end and line_end < size and regex.search(buf, line_start, line_end) is None:
+            pos = line_end + 1
+            continue
+        
+        if line_numbers:
+            line_number += _count_newlines(buf, counted_to, line_start) + 1
+            counted_to = line_end + 1
+        
+        found += 1
+        yield line_number, buf[line_start:line_end]
+        pos = line_end + 1
+
+def grep_file(path: str, name: str, pattern: bytes, flags: int, mode: str, max_count: Optional[int],
+              line_numbers: bool, labelled: bool) -> List[str]:
+    """Search one file, returning its output lines (runs in pool workers)
+    
+    name is the path as the user gave it; mode is "lines", "count" or
+    "files". Errors are returned as output.
+    """
+    regex = re.compile(pattern, flags | re.MULTILINE)
+    encoding = locale.getpreferredencoding(False)
+    prefix = f"{name}:" if labelled else ""
+    
+    try:
+        with open(path, 'rb') as f:
+            try:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # Empty file
+                buf = b""
+            except OSError:
+                # Not mappable (pipes, some special files): read it instead
+                buf = f.read()
+            
+            try:
+                if hasattr(buf, "madvise"):
+                    buf.madvise(mmap.MADV_SEQUENTIAL)
+                
+                binary = b"\0" in buf[:GREP_BINARY_PROBE]
+                if mode == "files" or (binary and mode == "lines"):
+                    # One match settles it
+                    if next(grep_buffer(buf, regex, 1), None) is None:
+                        return []
+                    if mode == "files":
+                        return [name]
+                    return [f"Binary file {name} matches"]
+                
+                matches = grep_buffer(buf, regex, max_count, line_numbers)
+                if mode == "count":
+                    return [f"{prefix}{sum(1 for _ in matches)}"]
+                return [f"{prefix}{f'{number}:' if line_numbers else ''}{line.decode(encoding, 'replace')}"
+                        for number, line in matches]
+            finally:
+                if isinstance(buf, mmap.mmap):
+                    buf.close()
+    except FileNotFoundError:
+        return [f"grep: {name}: No such file or directory"]
+    except IsADirectoryError:
+        return [f"grep: {name}: Is a directory"]
+    except PermissionError:
+        return [f"grep: {name}: Permission denied"]
+    except OSError as e:
+        return [f"grep: {name}: {e.strerror}"]
+
+class GrepCommand(FileSystemCommand):
+    """Print lines that match a pattern"""
+    reads_stdin = True
+    
+    # Files searched concurrently per worker process
+    WINDOW_PER_WORKER = 2
+    # Longest a found match waits to be batched with later ones
+    FLUSH_INTERVAL = 0.1
+    
+    def __init__(self, terminal):
+        super().__init__("grep", "Print lines that match a pattern", terminal)
+    
+    def execute(self, args: List[str]) -> str:
+        return "".join(self.stream(args))
+    
+    def help(self) -> str:
+        return ("grep: Print lines that match a pattern. "
+                "Usage: grep [-i] [-F] [-n] [-c] [-l] [-r] [-m NUM] PATTERN [FILE...]")
+    
+    def _parse_args(self, args: List[str]) -> Tuple[Dict[str, Any], List[str]]:
+        """Split arguments into options and operands, raising ValueError on bad usage"""
+        options: Dict[str, Any] = {"i": False, "F": False, "n": False, "c": False, "l": False, "r": False, "m": None}
+        long_options = {"--ignore-case": "i", "--fixed-strings": "F", "--line-number": "n", "--count": "c",
+                        "--files-with-matches": "l", "--recursive": "r"}
+        operands = []
+        
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            i += 1
+            if arg == "--":
+                operands.extend(args[i:])
+                break
+            elif arg in long_options:
+                options[long_options[arg]] = True
+            elif arg.startswith("--max-count="):
+                value = arg[len("--max-count="):]
+                if not value.isdigit():
+                    raise ValueError(f"invalid max count: '{value}'")
+                options["m"] = int(value)
+            elif arg.startswith("-") and len(arg) > 1 and not arg.startswith("--"):
+                flags = arg[1:]
+                while flags:
+                    flag, flags = flags[0], flags[1:]
+                    if flag == "m":
+                        # The count may be attached (-m5) or the next argument
+                        if not flags:
+                            if i >= len(args):
+                                raise ValueError("option requires an argument -- 'm'")
+                            flags = args[i]
+                            i += 1
+                        if not flags.isdigit():
+                            raise ValueError(f"invalid max count: '{flags}'")
+                        options["m"] = int(flags)
+                        flags = ""
+                    elif flag == "E":
+                        # Python patterns are already extended regular expressions
+                        pass
+                    elif flag in options:
+                        options[flag] = True
+                    else:
+                        raise ValueError(f"invalid option -- '{flag}'")
+            elif arg.startswith("--"):
+                raise ValueError(f"unrecognized option '{arg}'")
+            else:
+                operands.append(arg)
+        
+        return options, operands
+    
+    def stream(self, args: List[str], stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        try:
+            options, operands = self._parse_args(args)
+        except ValueError as e:
+            yield f"grep: {e}"
+            return
+        
+        if not operands:
+            yield "grep: missing pattern"
+            return
+        
+        pattern, paths = operands[0], operands[1:]
+        if options["F"]:
+            pattern = re.escape(pattern)
+        flags = re.IGNORECASE if options["i"] else 0
+        
+        # Compile once up front, both to report errors and for stdin
+        try:
+            regex = re.compile(pattern, flags)
+        except re.error as e:
+            yield f"grep: invalid pattern: {e}"
+            return
+        
+        mode = "files" if options["l"] else "count" if options["c"] else "lines"
+        
+        if not paths:
+            if stdin is None:
+                yield "grep: missing file operand"
+                return
+            # Not batched: tail -f | grep must show each match as it arrives
+            yield from self._grep_lines(iter_line_batches(stdin), regex, mode, options["m"], options["n"])
+            return
+        
+        labelled = len(paths) > 1 or options["r"]
+        files = self._iter_files(paths, options["r"])
+        
+        # Files are searched as raw bytes, so the pattern is too. Bytes
+        # patterns only ignore ASCII case, so -i with a non-ASCII pattern
+        # searches decoded text instead, matching what stdin would
+        try:
+            encoded = pattern.encode(locale.getpreferredencoding(False))
+        except UnicodeEncodeError:
+            encoded = None
+        if encoded is None or (options["i"] and not pattern.isascii()):
+            results = self._grep_text_files(files, regex, mode, options["m"], options["n"], labelled)
+        else:
+            try:
+                re.compile(encoded, flags | re.MULTILINE)
+            except re.error as e:
+                yield f"grep: invalid pattern: {e}"
+                return
+            results = self._grep_files(files, encoded, flags, mode, options["m"], options["n"], labelled)
+        yield from join_stream(results, "\n", max_delay=self.FLUSH_INTERVAL)
+    
+    def _grep_lines(self, batches: Iterable[List[str]], regex, mode: str, max_count: Optional[int],
+                    line_numbers: bool) -> Iterator[str]:
+        """Search standard input, yielding the matches of each chunk as it arrives
+        
+        Empty batches (heartbeats from tail -f or top -d) are passed on as
+        empty chunks, so a pipeline that runs until cancelled notices
+        cancellation even while nothing matches.
+        """
+        found = 0
+        number = 0
+        started = False
+        for batch in batches:
+            if not batch:
+                yield ""
+                continue
+            matches = []
+            for line in batch:
+                if max_count is not None and found >= max_count:
+                    break
+                number += 1
+                if regex.search(line):
+                    found += 1
+                    if mode == "files":
+                        yield "(standard input)"
+                        return
+                    if mode == "lines":
+                        matches.append(f"{number}:{line}" if line_numbers else line)
+            if matches:
+                yield ("\n" if started else "") + "\n".join(matches)
+                started = True
+            if max_count is not None and found >= max_count:
+                break
+        if mode == "count":
+            yield str(found)
+    
+    def _grep_text_files(self, files: Iterable[Tuple[str, str]], regex, mode: str, max_count: Optional[int],
+                         line_numbers: bool, labelled: bool) -> Iterator[str]:
+        """Search files line by line as decoded text, in this process"""
+        encoding = locale.getpreferredencoding(False)
+        for path, name in files:
+            prefix = f"{name}:" if labelled else ""
+            try:
+                with open(path, 'rb') as f:
+                    binary = b"\0" in f.read(GREP_BINARY_PROBE)
+                    f.seek(0)
+                    found = 0
+                    # newline="" keeps \r, as the bytes search does
+                    for number, line in enumerate(io.TextIOWrapper(f, encoding, 'replace', newline=""), 1):
+                        if max_count is not None and found >= max_count:
+                            break
+                        line = line.rstrip("\n")
+                        if regex.search(line):
+                            found += 1
+                            if mode == "files" or (binary and mode == "lines"):
+                                break
+                            if mode == "lines":
+                                yield f"{prefix}{f'{number}:' if line_numbers else ''}{line}"
+            except OSError as e:
+                yield f"grep: {name}: {e.strerror}"
+                continue
+            if mode == "count":
+                yield f"{prefix}{found}"
+            elif found and mode == "files":
+                yield name
+            elif found and binary:
+                yield f"Binary file {name} matches"
+    
+    def _iter_files(self, paths: List[str], recursive: bool) -> Iterator[Tuple[str, str]]:
+        """Yield (path, name) for each file to search, walking directories lazily"""
+        for path in paths:
+            full_path = self.terminal.resolve_path(path)
+            if recursive and os.path.isdir(full_path):
+                for root, dirs, files in os.walk(full_path):
+                    dirs.sort()
+                    for name in sorted(files):
+                        # Label with the path as given, like grep does
+                        yield os.path.join(root, name), os.path.join(path, os.path.relpath(os.path.join(root, name), full_path))
+            else:
+                yield full_path, path
+    
+    def _grep_files(self, files: Iterable[Tuple[str, str]], pattern: bytes, flags: int, mode: str,
+                    max_count: Optional[int], line_numbers: bool, labelled: bool) -> Iterator[str]:
+        """Search files, large ones in the process pool, yielding output in file order
+        
+        Pool workers hand back all of a file's output at once, which only
+        pays off when other files are searched meanwhile or the output is
+        small (-c, -l). In "lines" mode the last (or only) file is streamed
+        in this process, so its matches show as they are found.
+        """
+        pool = get_process_pool()
+        window = (os.cpu_count() or 1) * self.WINDOW_PER_WORKER
+        # Results in file order: completed lists, or (future, pool, args)
+        # for files searched in the pool
+        pending: "collections.deque[Any]" = collections.deque()
+        # Look one file ahead to know whether more are queued
+        files = iter(files)
+        following = next(files, None)
+        
+        try:
+            while following is not None:
+                path, name = following
+                following = next(files, None)
+                args = (path, name, pattern, flags, mode, max_count, line_numbers, labelled)
+                if mode == "lines" and following is None:
+                    # Nothing left to overlap with: finish what is queued, then stream
+                    while pending:
+                        yield from self._result(pending.popleft())
+                    yield from self._grep_file_streaming(path, name, pattern, flags, max_count, line_numbers, labelled)
+                elif pool is not None and self._is_large(path):
+                    try:
+                        pending.append((pool.submit(grep_file, *args), pool, args))
+                    except BrokenProcessPool:
+                        # A worker died; later greps get a fresh pool
+                        discard_process_pool(pool)
+                        pool = None
+                        pending.append(grep_file(*args))
+                elif not pending and mode == "lines":
+                    # Nothing queued ahead of it, so stream matches as they are found
+                    yield from self._grep_file_streaming(path, name, pattern, flags, max_count, line_numbers, labelled)
+                    continue
+                else:
+                    pending.append(grep_file(path, name, pattern, flags, mode, max_count, line_numbers, labelled))
+                
+                # Emit finished results from the front, keeping at most a
+                # window of files in flight
+                while pending and (len(pending) >= window or isinstance(pending[0], list) or pending[0][0].done()):
+                    yield from self._result(pending.popleft())
+            
+            while pending:
+                yield from self._result(pending.popleft())
+        finally:
+            # Stop queued work if the consumer went away
+            for item in pending:
+                if not isinstance(item, list):
+                    item[0].cancel()
+    
+    def _is_large(self, path: str) -> bool:
+        try:
+            return os.stat(path).st_size >= GREP_POOL_MIN_SIZE
+        except OSError:
+            return False
+    
+    def _result(self, item) -> List[str]:
+        if isinstance(item, list):
+            return item
+        future, pool, args = item
+        try:
+            return future.result()
+        except BrokenProcessPool:
+            # The pool died under this file: search it here instead
+            discard_process_pool(pool)
+            return grep_file(*args)
+        except Exception as e:
+            return [f"grep: {e}"]
+    
+    def _grep_file_streaming(self, path: str, name: str, pattern: bytes, flags: int, max_count: Optional[int],
+                             line_numbers: bool, labelled: bool) -> Iterator[str]:
+        """Search one text file in this process, yielding each match as it is found"""
+        try:
+            with open(path, 'rb') as f:
+                try:
+                    buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (ValueError, OSError):
+                    # Empty or unmappable: the pool-style search handles those
+                    buf = None
+                if buf is None or b"\0" in buf[:GREP_BINARY_PROBE]:
+                    if buf is not None:
+                        buf.close()
+                    yield from grep_file(path, name, pattern, flags, "lines", max_count, line_numbers, labelled)
+                    return
+                
+                with buf:
+                    if hasattr(buf, "madvise"):
+                        buf.madvise(mmap.MADV_SEQUENTIAL)
+                    encoding = locale.getpreferredencoding(False)
+                    prefix = f"{name}:" if labelled else ""
+                    regex = re.compile(pattern, flags | re.MULTILINE)
+                    for number, line in grep_buffer(buf, regex, max_count, line_numbers):
+                        yield f"{prefix}{f'{number}:' if line_numbers else ''}{line.decode(encoding, 'replace')}"
+        except OSError:
+            # Report the error the same way as every other file
+            yield from grep_file(path, name, pattern, flags, "lines", max_count, line_numbers, labelled)
+
+# Directory reads are latency-bound, so tree walks use more threads than cores
+WALK_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+# Seconds a walk's consumer waits for output before sending a heartbeat
+WALK_HEARTBEAT = 0.5
+
+class _WalkDone:
+    """Output marker: every queued directory has been scanned"""
+
+class ParallelWalk:
+    """Scan a directory tree on a work-stealing pool of threads
+    
+    scan(item) returns (results, children): results are handed to the
+    consumer as they are produced and children are scanned in turn. Each
+    worker keeps its own deque, taking new work from the end it pushes to
+    (depth first, for locality) and stealing the oldest work from the front
+    of other workers' deques when it runs dry.
+    """
+    def __init__(self, scan: Callable[[Any], Tuple[List[Any], List[Any]]], workers: int = WALK_WORKERS,
+                 max_output: int = 4096):
+        self.scan = scan
+        self.workers = max(1, workers)
+        self._deques: List[collections.deque] = [collections.deque() for _ in range(self.workers)]
+        # Queued plus in-progress items; the walk is over when it drops to zero
+        self._pending = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._output: queue.Queue = queue.Queue(max_output)
+    
+    def run(self, roots: Iterable[Any]) -> Iterator[Any]:
+        """Yield scan results until the tree is exhausted, or None after
+        WALK_HEARTBEAT seconds without any (so callers can heartbeat)
+        
+        Closing the iterator stops the workers.
+        """
+        roots = list(roots)
+        if not roots:
+            return
+        for i, root in enumerate(roots):
+            self._deques[i % self.workers].append(root)
+        self._pending = len(roots)
+        
+        threads = [threading.Thread(target=self._work, args=(i,), name=f"walk-{i}", daemon=True)
+                   for i in range(self.workers)]
+        for thread in threads:
+            thread.start()
+        
+        try:
+            while True:
+                try:
+                    item = self._output.get(timeout=WALK_HEARTBEAT)
+                except queue.Empty:
+                    yield None
+                    continue
+                if item is _WalkDone:
+                    return
+                yield item
+        finally:
+            self._stop.set()
+            with self._cond:
+                self._cond.notify_all()
+    
+    def pending_output(self) -> bool:
+        """Whether results are waiting to be taken, so callers can batch them"""
+        return not self._output.empty()
+    
+    def _take(self, index: int) -> Optional[Any]:
+        try:
+            return self._deques[index].pop()
+        except IndexError:
+            pass
+        # Steal from the others, starting with our neighbour
+        for offset in range(1, self.workers):
+            try:
+                return self._deques[(index + offset) % self.workers].popleft()
+            except IndexError:
+                continue
+        return None
+    
+    def _work(self, index: int):
+        own = self._deques[index]
+        while not self._stop.is_set():
+            item = self._take(index)
+            if item is None:
+                with self._cond:
+                    if self._pending == 0:
+                        return
+                    self._cond.wait(0.05)
+                continue
+            
+            try:
+                results, children = self.scan(item)
             except Exception as e:
-                results.append(f"cat: {path}: {str(e)}")
+                results, children = [e], []
+            
+            # Count children before anyone can steal and finish them
+            if children:
+                with self._cond:
+                    self._pending += len(children)
+                own.extend(children)
+                with self._cond:
+                    self._cond.notify_all()
+            
+            for result in results:
+                if not self._put(result):
+                    return
+            
+            with self._cond:
+                self._pending -= 1
+                done = self._pending == 0
+                if done:
+                    self._cond.notify_all()
+            if done:
+                self._put(_WalkDone)
+    
+    def _put(self, item: Any) -> bool:
+        """Hand an item to the consumer, giving up if the walk was stopped"""
+        while not self._stop.is_set():
+            try:
+                self._output.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+def parse_numeric_test(value: str) -> Tuple[str, float]:
+    """Split a find-style number into a comparison ('+', '-' or '=') and value"""
+    sign = value[:1] if value[:1] in "+-" else "="
+    number = value[1:] if sign != "=" else value
+    return sign, float(number)
+
+def compare_numeric(sign: str, actual: float, expected: float) -> bool:
+    if sign == "+":
+        return actual > expected
+    if sign == "-":
+        return actual < expected
+    return actual == expected
+
+class FindCommand(FileSystemCommand):
+    """Search for files in a directory hierarchy"""
+    # Units for -size; a bare number counts 512-byte blocks
+    SIZE_UNITS = {"c": 1, "b": 512, "k": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+    
+    def __init__(self, terminal):
+        super().__init__("find", "Search for files in a directory hierarchy", terminal)
+    
+    def execute(self, args: List[str]) -> str:
+        return "".join(chunk for chunk in self.stream(args) if chunk)
+    
+    def help(self) -> str:
+        return ("find: Search for files in a directory hierarchy. "
+                "Usage: find [PATH...] [-name GLOB] [-iname GLOB] [-type f|d|l] "
+                "[-size [+-]N[cbkMG]] [-mtime [+-]DAYS] [-mmin [+-]MINUTES] [-maxdepth N]")
+    
+    def _parse_args(self, args: List[str]) -> Tuple[List[str], List[Callable[[os.DirEntry], bool]], Optional[int]]:
+        """Return (paths, tests, maxdepth), raising ValueError on bad usage"""
+        paths = []
+        i = 0
+        while i < len(args) and not args[i].startswith("-"):
+            paths.append(args[i])
+            i += 1
+        
+        tests: List[Callable[[os.DirEntry], bool]] = []
+        maxdepth = None
+        now = time.time()
+        
+        while i < len(args):
+            option = args[i]
+            if i + 1 >= len(args):
+                raise ValueError(f"missing argument to `{option}'")
+            value = args[i + 1]
+            i += 2
+            
+            if option in ("-name", "-iname"):
+                # Translate the glob once rather than per entry
+                regex = re.compile(fnmatch.translate(value), re.IGNORECASE if option == "-iname" else 0)
+                tests.append(lambda entry, match=regex.match: match(entry.name) is not None)
+            elif option == "-type":
+                checks = {
+                    "f": lambda entry: entry.is_file(follow_symlinks=False),
+                    "d": lambda entry: entry.is_dir(follow_symlinks=False),
+                    "l": lambda entry: entry.is_symlink(),
+                }
+                if value not in checks:
+                    raise ValueError(f"Unknown argument to -type: {value}")
+                tests.append(checks[value])
+            elif option == "-size":
+                unit = self.SIZE_UNITS.get(value[-1:])
+                number = value[:-1] if unit else value
+                try:
+                    sign, expected = parse_numeric_test(number)
+                except ValueError:
+                    raise ValueError(f"invalid -size argument `{value}'")
+                unit = unit or 512
+                # Sizes round up to whole units, as in find
+                tests.append(lambda entry, sign=sign, expected=expected, unit=unit:
+                             compare_numeric(sign, math.ceil(entry.stat(follow_symlinks=False).st_size / unit), expected))
+            elif option in ("-mtime", "-mmin"):
+                try:
+                    sign, expected = parse_numeric_test(value)
+                except ValueError:
+                    raise ValueError(f"invalid argument `{value}' to `{option}'")
+                period = 86400 if option == "-mtime" else 60
+                # Ages are whole periods, rounded down
+                tests.append(lambda entry, sign=sign, expected=expected, period=period:
+                             compare_numeric(sign, (now - entry.stat(follow_symlinks=False).st_mtime) // period, expected))
+            elif option == "-maxdepth":
+                if not value.isdigit():
+                    raise ValueError(f"invalid -maxdepth argument `{value}'")
+                maxdepth = int(value)
+            else:
+                raise ValueError(f"unknown predicate `{option}'")
+        
+        return paths or ["."], tests, maxdepth
+    
+    def stream(self, args: List[str], stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        try:
+            paths, tests, maxdepth = self._parse_args(args)
+        except ValueError as e:
+            yield f"find: {e}"
+            return
         
-        return "\n".join(results)
+        def matches(entry) -> bool:
+            try:
+                return all(test(entry) for test in tests)
+            except OSError:
+                # Vanished since it was listed
+                return False
+        
+        def scan(item: Tuple[str, str, int]) -> Tuple[List[str], List[Tuple[str, str, int]]]:
+            full_path, shown, depth = item
+            results = []
+            children = []
+            try:
+                with os.scandir(full_path) as entries:
+                    for entry in entries:
+                        shown_path = os.path.join(shown, entry.name)
+                        if matches(entry):
+                            results.append(shown_path)
+                        try:
+                            descend = entry.is_dir(follow_symlinks=False)
+                        except OSError:
+                            descend = False
+                        if descend and (maxdepth is None or depth + 1 < maxdepth):
+                            children.append((entry.path, shown_path, depth + 1))
+            except OSError as e:
+                results.append(f"find: '{shown}': {e.strerror}")
+            return results, children
+        
+        roots = []
+        header = []
+        for path in paths:
+            full_path = self.terminal.resolve_path(path)
+            try:
+                # The starting points are tested too, as find does
+                if matches(_PathEntry(full_path)):
+                    header.append(path)
+            except OSError as e:
+                header.append(f"find: '{path}': {e.strerror}")
+                continue
+            if os.path.isdir(full_path) and maxdepth != 0:
+                roots.append((full_path, path, 0))
+        
+        yield from self._stream_results(header, ParallelWalk(scan).run(roots))
+    
+    def _stream_results(self, header: List[str], results: Iterator[Optional[str]]) -> Iterator[str]:
+        """Join results with newlines, flushing whenever the walk has nothing ready"""
+        batch = ["\n".join(header)] if header else []
+        size = len(batch[0]) if batch else 0
+        started = bool(header)
+        
+        for result in results:
+            if result is None:
+                # Nothing new for a while: flush, or send an idle heartbeat
+                yield "".join(batch)
+                batch = []
+                size = 0
+                continue
+            if isinstance(result, Exception):
+                result = f"find: {result}"
+            if started:
+                batch.append("\n")
+            started = True
+            batch.append(result)
+            size += len(result) + 1
+            if size >= CHUNK_SIZE:
+                yield "".join(batch)
+                batch = []
+                size = 0
+        
+        if batch:
+            yield "".join(batch)
+
+class _PathEntry:
+    """Minimal os.DirEntry look-alike for find's starting points"""
+    def __init__(self, path: str):
+        self.path = path
+        self.name = os.path.basename(os.path.normpath(path))
+        self._stat = os.lstat(path)
+    
+    def stat(self, follow_symlinks: bool = True) -> os.stat_result:
+        return os.stat(self.path) if follow_symlinks else self._stat
+    
+    def is_dir(self, follow_symlinks: bool = True) -> bool:
+        return stat.S_ISDIR(self.stat(follow_symlinks).st_mode)
+    
+    def is_file(self, follow_symlinks: bool = True) -> bool:
+        return stat.S_ISREG(self.stat(follow_symlinks).st_mode)
+    
+    def is_symlink(self) -> bool:
+        return stat.S_ISLNK(self._stat.st_mode)
+
+def human_readable_size(size_bytes: float) -> str:
+    """Convert size in bytes to human readable format"""
+    for unit in ['B', 'K', 'M', 'G', 'T', 'P']:
+        if size_bytes < 1024 or unit == 'P':
+            return f"{size_bytes:.1f}{unit}"
+        size_bytes /= 1024
+
+class DirectorySizeCache:
+    """Bounded, process-wide index of what each directory directly contains
+    
+    Entries are keyed by (dev, inode) and only trusted while the directory's
+    mtime is unchanged. Adding, removing or renaming entries updates a
+    directory's mtime, so unchanged directories skip the directory read.
+    Only names are kept: files can grow in place without touching the
+    directory, so their sizes are always re-read with lstat.
+    
+    Each entry holds the directory's subdirectory names and the names of
+    everything else in it. The bound is on the total number of names.
+    """
+    def __init__(self, max_entries: int = 200000):
+        self.max_entries = max_entries
+        self._entries: "collections.OrderedDict[Tuple[int, int], Tuple[Any, ...]]" = collections.OrderedDict()
+        self._total_entries = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key: Tuple[int, int], mtime_ns: int) -> Optional[Tuple[Tuple[str, ...], Tuple[str, ...]]]:
+        """Return (subdirectory names, other names) if still valid"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != mtime_ns:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1], entry[2]
+    
+    def put(self, key: Tuple[int, int], mtime_ns: int, subdirs: Tuple[str, ...], files: Tuple[str, ...]):
+        size = len(subdirs) + len(files)
+        if size > self.max_entries // 4:
+            # One huge directory would push out everything else
+            return
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = (mtime_ns, subdirs, files)
+            self._total_entries += size
+            while self._total_entries > self.max_entries:
+                _, (_, evicted_dirs, evicted_files) = self._entries.popitem(last=False)
+                self._total_entries -= len(evicted_dirs) + len(evicted_files)
+    
+    def _drop(self, key: Tuple[int, int]):
+        """Remove one entry (caller holds the lock)"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._total_entries -= len(entry[1]) + len(entry[2])
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+# Shared by every terminal, so repeated du runs anywhere benefit
+directory_sizes = DirectorySizeCache()
+
+class DuCommand(FileSystemCommand):
+    """Estimate file space usage"""
+    # Directories modified this recently may change again within the same
+    # mtime tick, so they are never cached
+    CACHE_SETTLE_NS = 1_000_000_000
+    
+    def __init__(self, terminal):
+        super().__init__("du", "Estimate file space usage", terminal)
+    
+    def execute(self, args: List[str]) -> str:
+        return "".join(self.stream(args))
+    
+    def help(self) -> str:
+        return ("du: Estimate file space usage. "
+                "Usage: du [-h] [-s] [-b] [-d N] [--apparent-size] [PATH...]")
+    
+    def _parse_args(self, args: List[str]) -> Tuple[Dict[str, Any], List[str]]:
+        options: Dict[str, Any] = {"h": False, "s": False, "d": None, "apparent": False, "bytes": False}
+        paths = []
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            i += 1
+            if arg in ("-h", "--human-readable"):
+                options["h"] = True
+            elif arg in ("-s", "--summarize"):
+                options["s"] = True
+            elif arg == "--apparent-size":
+                options["apparent"] = True
+            elif arg in ("-b", "--bytes"):
+                options["apparent"] = options["bytes"] = True
+            elif arg == "-d" or arg.startswith("--max-depth="):
+                if arg == "-d":
+                    if i >= len(args):
+                        raise ValueError("option requires an argument -- 'd'")
+                    value = args[i]
+                    i += 1
+                else:
+                    value = arg[len("--max-depth="):]
+                if not value.isdigit():
+                    raise ValueError(f"invalid maximum depth '{value}'")
+                options["d"] = int(value)
+            elif arg.startswith("-") and len(arg) > 1:
+                raise ValueError(f"invalid option -- '{arg.lstrip('-')}'")
+            else:
+                paths.append(arg)
+        if options["s"]:
+            options["d"] = 0
+        return options, paths or ["."]
+    
+    def stream(self, args: List[str], stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        try:
+            options, paths = self._parse_args(args)
+        except ValueError as e:
+            yield f"du: {e}"
+            return
+        
+        # Never cache directories that might still change within one mtime tick
+        settled_before = time.time_ns() - self.CACHE_SETTLE_NS
+        size_index = 1 if options["apparent"] else 0
+        
+        def scan(item: Tuple[str, str, os.stat_result]):
+            full_path, shown, st = item
+            key = (st.st_dev, st.st_ino)
+            errors = []
+            # The cache is looked up at call time rather than kept on the
+            # command, so per-session memory accounting doesn't include it
+            cached = directory_sizes.get(key, st.st_mtime_ns)
+            
+            # The directory itself takes up space too
+            blocks, apparent = st.st_blocks * 512, st.st_size
+            children = []
+            links = []
+            
+            def add(path: str, name: str, entry_stat: os.stat_result):
+                nonlocal blocks, apparent
+                if stat.S_ISDIR(entry_stat.st_mode):
+                    children.append((path, os.path.join(shown, name), entry_stat))
+                elif entry_stat.st_nlink > 1:
+                    links.append(((entry_stat.st_dev, entry_stat.st_ino),
+                                  entry_stat.st_blocks * 512, entry_stat.st_size))
+                else:
+                    blocks += entry_stat.st_blocks * 512
+                    apparent += entry_stat.st_size
+            
+            if cached is not None:
+                # Names are unchanged, but files may have grown in place
+                for name in itertools.chain(*cached):
+                    path = os.path.join(full_path, name)
+                    try:
+                        add(path, name, os.lstat(path))
+                    except OSError:
+                        # Lost a race with a change; the next run rescans
+                        continue
+            else:
+                subdirs = []
+                files = []
+                try:
+                    with os.scandir(full_path) as entries:
+                        for entry in entries:
+                            try:
+                                entry_stat = entry.stat(follow_symlinks=False)
+                            except OSError:
+                                continue
+                            (subdirs if stat.S_ISDIR(entry_stat.st_mode) else files).append(entry.name)
+                            add(entry.path, entry.name, entry_stat)
+                except OSError as e:
+                    errors.append(f"du: cannot read directory '{shown}': {e.strerror}")
+                    subdirs = None
+                
+                if subdirs is not None and st.st_mtime_ns < settled_before:
+                    directory_sizes.put(key, st.st_mtime_ns, tuple(subdirs), tuple(files))
+            
+            own = (blocks, apparent)[size_index]
+            linked = [(link[0], link[1 + size_index]) for link in links]
+            return errors + [(shown, own, linked, [child[1] for child in children])], children
+        
+        lines = []
+        roots = []
+        for path in paths:
+            full_path = self.terminal.resolve_path(path)
+            try:
+                st = os.lstat(full_path)
+            except OSError as e:
+                lines.append(f"du: cannot access '{path}': {e.strerror}")
+                continue
+            if stat.S_ISDIR(st.st_mode):
+                roots.append((full_path, path, st))
+            else:
+                size = st.st_size if options["apparent"] else st.st_blocks * 512
+                lines.append(self._format(size, path, options))
+        
+        own: Dict[str, int] = {}
+        linked: Dict[str, List[Tuple[Tuple[int, int], int]]] = {}
+        children: Dict[str, List[str]] = {}
+        for result in ParallelWalk(scan).run(roots):
+            if result is None:
+                # Still walking; keep the consumer's cancellation responsive
+                yield ""
+            elif isinstance(result, tuple):
+                shown, size, links, child_paths = result
+                own[shown] = size
+                linked[shown] = links
+                children[shown] = child_paths
+            else:
+                lines.append(str(result))
+        
+        # Hard-linked files count once, wherever they are first reached
+        seen = set()
+        for _, shown, _ in roots:
+            lines.extend(self._totals(shown, own, linked, children, seen, options))
+        yield from join_stream(lines, "\n")
+    
+    def _totals(self, root: str, own: Dict[str, int], linked: Dict[str, List[Tuple[Tuple[int, int], int]]],
+                children: Dict[str, List[str]], seen: set, options: Dict[str, Any]) -> List[str]:
+        """Sum subtrees bottom-up, returning lines children-first like du"""
+        totals: Dict[str, int] = {}
+        max_depth = options["d"]
+        lines = []
+        # Iterative post-order, since trees can be deeper than the recursion limit
+        stack = [(root, 0, False)]
+        while stack:
+            path, depth, expanded = stack.pop()
+            if path not in own:
+                continue
+            if not expanded:
+                stack.append((path, depth, True))
+                stack.extend((child, depth + 1, False) for child in sorted(children[path], reverse=True))
+                continue
+            total = own[path] + sum(totals.get(child, 0) for child in children[path])
+            for key, size in linked[path]:
+                if key not in seen:
+                    seen.add(key)
+                    total += size
+            totals[path] = total
+            if max_depth is None or depth <= max_depth:
+                lines.append(self._format(total, path, options))
+        return lines
+    
+    def _format(self, size: int, path: str, options: Dict[str, Any]) -> str:
+        # Like du, sizes are in kilobytes unless asked otherwise
+        if options["h"]:
+            shown = human_readable_size(size)
+        elif options["bytes"]:
+            shown = str(size)
+        else:
+            shown = str(math.ceil(size / 1024))
+        return f"{shown}\t{path}"
 
 class EchoCommand(Command):
     """Echo arguments command"""
+    blocking = False
+    
     def __init__(self):
         super().__init__("echo", "Display a line of text")
     
@@ -244,39 +2001,244 @@ class SystemCommand(Command):
     def __init__(self, name: str, description: str):
         super().__init__(name, description)
 
+def user_name(uid: int, names: Dict[int, str]) -> str:
+    """Name of a uid, memoized in names (the numeric id if it has no entry)"""
+    name = names.get(uid)
+    if name is None:
+        try:
+            name = pwd.getpwuid(uid).pw_name if pwd is not None else str(uid)
+        except KeyError:
+            name = str(uid)
+        names[uid] = name
+    return name
+
+def user_id(user: str) -> Any:
+    """Resolve a user name or numeric id, raising ValueError if unknown
+    
+    Without uids (Windows) processes are matched by name instead.
+    """
+    if pwd is None:
+        return user
+    if user.isdigit():
+        return int(user)
+    try:
+        return pwd.getpwnam(user).pw_uid
+    except KeyError:
+        raise ValueError(f"user name does not exist: {user}")
+
+
+def format_cpu_time(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    return f"{minutes}:{seconds:02d}"
+
 class PsCommand(SystemCommand):
     """Process status command"""
+    # Column key -> (header, function of (ProcessInfo, context)); the
+    # context holds values computed once per listing
+    COLUMNS: Dict[str, Tuple[str, Callable[[Any, Dict[str, Any]], Any]]] = {
+        "pid": ("PID", lambda proc, ctx: proc.pid),
+        "ppid": ("PPID", lambda proc, ctx: proc.ppid),
+        "user": ("USER", lambda proc, ctx: user_name(proc.owner, ctx["names"])),
+        "uid": ("UID", lambda proc, ctx: proc.owner),
+        "cpu": ("CPU%", lambda proc, ctx: proc.cpu_percent),
+        "mem": ("MEM%", lambda proc, ctx: proc.rss * 100.0 / ctx["total_memory"]),
+        "rss": ("RSS", lambda proc, ctx: proc.rss // 1024),
+        "vsz": ("VSZ", lambda proc, ctx: proc.vms // 1024),
+        "stat": ("STAT", lambda proc, ctx: proc.status),
+        "threads": ("THREADS", lambda proc, ctx: proc.threads),
+        "time": ("TIME", lambda proc, ctx: proc.cpu_time),
+        "comm": ("COMMAND", lambda proc, ctx: proc.name),
+    }
+    ALIASES = {"%cpu": "cpu", "pcpu": "cpu", "%mem": "mem", "pmem": "mem", "command": "comm", "name": "comm",
+               "cmd": "comm", "nlwp": "threads", "cputime": "time", "state": "stat", "vms": "vsz"}
+    DEFAULT_COLUMNS = ["pid", "cpu", "mem", "comm"]
+    # How columns other than plain str() ones are shown
+    FORMATS: Dict[str, Callable[[Any], str]] = {"cpu": "{:.1f}".format, "mem": "{:.1f}".format, "time": format_cpu_time}
+    
     def __init__(self):
         super().__init__("ps", "Report process status")
     
+    def help(self) -> str:
+        return ("ps: Report process status. Usage: ps [-a] [-u USER[,USER...]] "
+                f"[-o COLUMN[,COLUMN...]] [--sort [-]COLUMN]. Columns: {', '.join(self.COLUMNS)}")
+    
+    def _column(self, name: str) -> str:
+        key = self.ALIASES.get(name.lower(), name.lower())
+        if key not in self.COLUMNS:
+            raise ValueError(f"unknown column '{name}'")
+        return key
+    
+    def _parse_args(self, args: List[str]) -> Dict[str, Any]:
+        """Parse options, raising ValueError on bad usage"""
+        options: Dict[str, Any] = {"all": False, "users": None, "columns": [], "sort": []}
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            i += 1
+            name, has_value, value = arg.partition("=")
+            if arg in ("-a", "-e", "-A", "--all"):
+                options["all"] = True
+            elif name in ("-u", "--user", "-o", "--format", "--sort") or (arg[:2] in ("-u", "-o") and len(arg) > 2):
+                if arg[:2] in ("-u", "-o") and len(arg) > 2 and not arg.startswith("--"):
+                    name, value = arg[:2], arg[2:]
+                elif not has_value:
+                    if i >= len(args):
+                        raise ValueError(f"option '{name}' requires an argument")
+                    value = args[i]
+                    i += 1
+                items = [item for item in value.split(",") if item]
+                if name in ("-u", "--user"):
+                    options["users"] = (options["users"] or set()) | {user_id(user) for user in items}
+                elif name == "--sort":
+                    # A leading '-' sorts that key in descending order
+                    options["sort"] += [(self._column(item.lstrip("+-")), item.startswith("-")) for item in items]
+                else:
+                    options["columns"] += [self._column(item) for item in items]
+            else:
+                raise ValueError(f"unknown option '{arg}'")
+        return options
+    
     def execute(self, args: List[str]) -> str:
-        show_all = "-a" in args or "--all" in args
+        try:
+            options = self._parse_args(args)
+        except ValueError as e:
+            return f"ps: {e}"
         
-        header = "PID\tCPU%\tMEM%\tCOMMAND"
-        processes = []
+        columns = options["columns"] or self.DEFAULT_COLUMNS
+        sort_keys = [key for key, _ in options["sort"]]
+        needed = list(dict.fromkeys(columns + sort_keys))
         
-        for proc in psutil.process_iter(['pid', 'name', 'username', 'cpu_percent', 'memory_percent']):
-            try:
-                # Skip processes not owned by current user unless -a is specified
-                if not show_all and proc.info['username'] != os.getlogin():
-                    continue
-                
-                processes.append(f"{proc.info['pid']}\t{proc.info['cpu_percent']:.1f}\t{proc.info['memory_percent']:.1f}\t{proc.info['name']}")
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                pass
+        # Filter on the numeric uid, resolved once: no per-process user
+        # lookups, and no login name needed (daemons and containers have none)
+        users = options["users"]
+        if users is None and not options["all"]:
+            users = {os.getuid() if pwd is not None else getpass.getuser()}
+        
+        # The background sampler already holds the process table, with CPU
+        # usage measured between its last two samples
+        snapshot = system_sampler.snapshot()
+        context: Dict[str, Any] = {"names": {}, "total_memory": snapshot.memory.total}
+        getters = [self.COLUMNS[key][1] for key in needed]
+        rows = [[getter(proc, context) for getter in getters]
+                for proc in snapshot.processes if users is None or proc.owner in users]
         
-        return header + "\n" + "\n".join(processes)
+        # Stable sorts applied from the last key to the first
+        for key, descending in reversed(options["sort"]):
+            rows.sort(key=operator.itemgetter(needed.index(key)), reverse=descending)
+        
+        formats = [(needed.index(key), self.FORMATS.get(key, str)) for key in columns]
+        header = "\t".join(self.COLUMNS[key][0] for key in columns)
+        return header + "\n" + "\n".join("\t".join([format(row[i]) for i, format in formats]) for row in rows)
 
 class TopCommand(SystemCommand):
     """Display system resource usage and processes"""
+    # Shortest refresh interval accepted by -d
+    MIN_DELAY = 0.1
+    # How often a waiting live top yields, so it can be cancelled
+    HEARTBEAT_INTERVAL = 1.0
+    # Sort keys for -o; processes are listed highest first
+    SORT_KEYS: Dict[str, Callable[[Any], Any]] = {
+        "cpu": operator.attrgetter("cpu_percent"),
+        "mem": operator.attrgetter("rss"),
+        "rss": operator.attrgetter("rss"),
+        "pid": operator.attrgetter("pid"),
+        "time": operator.attrgetter("cpu_time"),
+    }
+    DEFAULT_ROWS = 10
+    
     def __init__(self):
         super().__init__("top", "Display system resource usage and processes")
     
+    def help(self) -> str:
+        return ("top: Display system resource usage and processes. "
+                f"Usage: top [-d SECONDS] [-n ROWS] [-o {'|'.join(self.SORT_KEYS)}]")
+    
+    def runs_until_cancelled(self, args: List[str]) -> bool:
+        try:
+            return self._parse_args(args)["delay"] is not None
+        except ValueError:
+            return False
+    
+    def _parse_args(self, args: List[str]) -> Dict[str, Any]:
+        """Parse options, raising ValueError on bad usage
+        
+        The delay is None for a single screen.
+        """
+        options: Dict[str, Any] = {"delay": None, "rows": self.DEFAULT_ROWS, "sort": "cpu"}
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            i += 1
+            name, has_value, value = arg.partition("=")
+            if name in ("-d", "--delay", "-n", "--rows", "-o", "--sort"):
+                if not has_value:
+                    if i >= len(args):
+                        raise ValueError(f"option '{name}' requires an argument")
+                    value = args[i]
+                    i += 1
+            elif arg[:2] in ("-d", "-n", "-o") and not arg.startswith("--"):
+                name, value = arg[:2], arg[2:]
+            else:
+                raise ValueError(f"unknown option '{arg}'")
+            
+            if name in ("-d", "--delay"):
+                try:
+                    delay = float(value)
+                except ValueError:
+                    raise ValueError(f"bad delay interval '{value}'") from None
+                if not 0 < delay < math.inf:
+                    raise ValueError(f"bad delay interval '{value}'")
+                options["delay"] = max(delay, self.MIN_DELAY)
+            elif name in ("-n", "--rows"):
+                if not value.isdigit():
+                    raise ValueError(f"bad number of rows '{value}'")
+                options["rows"] = int(value)
+            else:
+                if value.lower() not in self.SORT_KEYS:
+                    raise ValueError(f"unknown sort key '{value}'")
+                options["sort"] = value.lower()
+        return options
+    
     def execute(self, args: List[str]) -> str:
-        # Get system information
-        cpu_percent = psutil.cpu_percent(interval=0.1)
-        memory = psutil.virtual_memory()
-        swap = psutil.swap_memory()
+        return "".join(self.stream(args))
+    
+    def stream(self, args: List[str], stdin: Optional[Iterator[str]] = None) -> Iterator[str]:
+        try:
+            options = self._parse_args(args)
+        except ValueError as e:
+            yield f"top: {e}"
+            return
+        
+        delay = options["delay"]
+        key = self.SORT_KEYS[options["sort"]]
+        rows = options["rows"]
+        if delay is None:
+            # One screen, without the trailing newline live frames end with
+            yield self._frame(system_sampler.snapshot(), key, rows)[:-1]
+            return
+        
+        # Live mode: a full frame every delay seconds until cancelled. The
+        # sampler does the measuring, so each refresh only formats its
+        # latest snapshot
+        names: Dict[int, str] = {}
+        while True:
+            yield self._frame(system_sampler.snapshot(), key, rows, names)
+            deadline = time.monotonic() + delay
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                time.sleep(min(remaining, self.HEARTBEAT_INTERVAL))
+                yield ""
+    
+    def _frame(self, snapshot, key: Callable[[Any], Any], count: int,
+               names: Optional[Dict[int, str]] = None) -> ScreenFrame:
+        """Format one screen: system figures, then the top processes by key, keyed by pid"""
+        if names is None:
+            names = {}
+        cpu_percent = round(snapshot.cpu_percent, 1)
+        memory = snapshot.memory
+        swap = snapshot.swap
         
         # Format system information
         system_info = [
@@ -285,58 +2247,106 @@ class TopCommand(SystemCommand):
             f"Swap: {swap.percent}% used ({swap.used / (1024**3):.1f}GB / {swap.total / (1024**3):.1f}GB)"
         ]
         
-        # Get process information (top 10 by CPU usage)
-        processes = []
-        for proc in sorted(psutil.process_iter(['pid', 'name', 'username', 'cpu_percent', 'memory_percent']), 
-                          key=lambda p: p.info['cpu_percent'], reverse=True)[:10]:
-            try:
-                processes.append(f"{proc.info['pid']:5d} {proc.info['username']:10s} {proc.info['cpu_percent']:5.1f} {proc.info['memory_percent']:5.1f} {proc.info['name']}")
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
-                pass
+        # Get process information: a bounded heap keeps only the top rows,
+        # so the cost stays linear in the number of processes
+        rows = []
+        for proc in heapq.nlargest(count, snapshot.processes, key=key):
+            memory_percent = proc.rss * 100.0 / memory.total
+            rows.append((str(proc.pid), (f"{proc.pid:5d}", f"{user_name(proc.owner, names):10s}",
+                                         f"{proc.cpu_percent:5.1f}", f"{memory_percent:5.1f}", proc.name)))
         
-        # Format output
         header = "PID     USER       CPU%  MEM%  COMMAND"
-        return "\n".join(system_info) + "\n\n" + header + "\n" + "\n".join(processes)
+        return ScreenFrame(system_info + ["", header], rows)
 
 class DfCommand(SystemCommand):
     """Report file system disk space usage"""
+    # How long to wait for a mount to answer before reporting it as stale
+    PROBE_TIMEOUT = 2.0
+    
     def __init__(self):
         super().__init__("df", "Report file system disk space usage")
     
+    def help(self) -> str:
+        return "df: Report file system disk space usage. Usage: df [-h] [-i] [-t TYPE] [-x TYPE]"
+    
+    def _parse_args(self, args: List[str]) -> Dict[str, Any]:
+        """Parse options, raising ValueError on bad usage"""
+        options: Dict[str, Any] = {"human": False, "inodes": False, "types": None, "excluded": set()}
+        i = 0
+        while i < len(args):
+            arg = args[i]
+            i += 1
+            name, has_value, value = arg.partition("=")
+            if arg in ("-h", "--human-readable"):
+                options["human"] = True
+            elif arg in ("-i", "--inodes"):
+                options["inodes"] = True
+            elif len(arg) > 2 and arg[0] == "-" and set(arg[1:]) <= set("hi"):
+                # Combined short flags, as in df -hi
+                options["human"] = options["human"] or "h" in arg
+                options["inodes"] = options["inodes"] or "i" in arg
+            elif name in ("-t", "--type", "-x", "--exclude-type") or (arg[:2] in ("-t", "-x") and len(arg) > 2):
+                if arg[:2] in ("-t", "-x") and len(arg) > 2 and not arg.startswith("--"):
+                    name, value = arg[:2], arg[2:]
+                elif not has_value:
+                    if i >= len(args):
+                        raise ValueError(f"option '{name}' requires an argument")
+                    value = args[i]
+                    i += 1
+                types = {item for item in value.split(",") if item}
+                if name in ("-t", "--type"):
+                    options["types"] = (options["types"] or set()) | types
+                else:
+                    options["excluded"] |= types
+            else:
+                raise ValueError(f"unknown option '{arg}'")
+        return options
+    
     def execute(self, args: List[str]) -> str:
-        human_readable = "-h" in args or "--human-readable" in args
+        try:
+            options = self._parse_args(args)
+        except ValueError as e:
+            return f"df: {e}"
         
-        header = "Filesystem\tSize\tUsed\tAvail\tUse%\tMounted on"
-        partitions = []
+        # The partition list is cached until the mount table changes
+        partitions = [part for part in mount_table.partitions()
+                      if (options["types"] is None or part.fstype in options["types"])
+                      and part.fstype not in options["excluded"]]
         
-        for part in psutil.disk_partitions(all=False):
-            try:
-                usage = psutil.disk_usage(part.mountpoint)
-                
-                if human_readable:
-                    size = self._human_readable_size(usage.total)
-                    used = self._human_readable_size(usage.used)
-                    free = self._human_readable_size(usage.free)
+        if options["inodes"]:
+            header = "Filesystem\tInodes\tIUsed\tIFree\tIUse%\tMounted on"
+        else:
+            header = "Filesystem\tSize\tUsed\tAvail\tUse%\tMounted on"
+        
+        # Mounts are probed concurrently, so one hung mount costs at most
+        # the timeout instead of blocking the command
+        rows = []
+        for part, usage in mount_table.probe(partitions, self.PROBE_TIMEOUT):
+            if usage is None:
+                rows.append(f"{part.device}\t-\t-\t-\t-\t{part.mountpoint} (stale)")
+            elif options["inodes"]:
+                percent = f"{round(usage.inodes_used * 100.0 / usage.inodes)}%" if usage.inodes else "-"
+                counts = [self._count(n, options["human"]) for n in (usage.inodes, usage.inodes_used, usage.inodes_free)]
+                rows.append(f"{part.device}\t" + "\t".join(counts) + f"\t{percent}\t{part.mountpoint}")
+            else:
+                if options["human"]:
+                    size, used, free = (human_readable_size(n) for n in (usage.total, usage.used, usage.free))
                 else:
-                    size = str(usage.total)
-                    used = str(usage.used)
-                    free = str(usage.free)
-                
-                partitions.append(f"{part.device}\t{size}\t{used}\t{free}\t{usage.percent}%\t{part.mountpoint}")
-            except (PermissionError, FileNotFoundError):
-                pass
+                    size, used, free = str(usage.total), str(usage.used), str(usage.free)
+                rows.append(f"{part.device}\t{size}\t{used}\t{free}\t{usage.percent}%\t{part.mountpoint}")
         
-        return header + "\n" + "\n".join(partitions)
+        return header + "\n" + "\n".join(rows)
     
-    def _human_readable_size(self, size_bytes):
-        """Convert size in bytes to human readable format"""
-        for unit in ['B', 'K', 'M', 'G', 'T', 'P']:
-            if size_bytes < 1024 or unit == 'P':
-                return f"{size_bytes:.1f}{unit}"
-            size_bytes /= 1024
+    def _count(self, count: int, human_readable: bool) -> str:
+        """Format an inode count, scaled like sizes (without the unit) for -h"""
+        if not human_readable or count < 1024:
+            return str(count)
+        return human_readable_size(count)
 
 class HistoryCommand(Command):
     """Display command history"""
+    blocking = False
+    
     def __init__(self, terminal):
         super().__init__("history", "Display command history")
         self.terminal = terminal
@@ -360,6 +2370,8 @@ class HistoryCommand(Command):
 
 class ClearCommand(Command):
     """Clear the terminal screen"""
+    blocking = False
+    
     def __init__(self):
         super().__init__("clear", "Clear the terminal screen")
     
@@ -369,6 +2381,8 @@ class ClearCommand(Command):
 
 class ExitCommand(Command):
     """Exit the terminal"""
+    blocking = False
+    
     def __init__(self):
         super().__init__("exit", "Exit the terminal")
     
@@ -378,6 +2392,8 @@ class ExitCommand(Command):
 
 class HelpCommand(Command):
     """Display help information"""
+    blocking = False
+    
     def __init__(self, terminal):
         super().__init__("help", "Display help information for commands")
         self.terminal = terminal
@@ -407,13 +2423,17 @@ class Terminal:
     def register_commands(self):
         """Register all available commands"""
         # File system commands
-        self.register_command(PwdCommand())
-        self.register_command(LsCommand())
-        self.register_command(CdCommand())
-        self.register_command(MkdirCommand())
-        self.register_command(RmCommand())
-        self.register_command(TouchCommand())
-        self.register_command(CatCommand())
+        self.register_command(PwdCommand(self))
+        self.register_command(LsCommand(self))
+        self.register_command(CdCommand(self))
+        self.register_command(MkdirCommand(self))
+        self.register_command(RmCommand(self))
+        self.register_command(TouchCommand(self))
+        self.register_command(CatCommand(self))
+        self.register_command(TailCommand(self))
+        self.register_command(GrepCommand(self))
+        self.register_command(FindCommand(self))
+        self.register_command(DuCommand(self))
         
         # System commands
         self.register_command(EchoCommand())
@@ -431,9 +2451,21 @@ class Terminal:
         """Register a command with the terminal"""
         self.commands[command.name] = command
     
+    def resolve_path(self, path: str) -> str:
+        """Resolve a path against this terminal's working directory"""
+        return os.path.join(self.current_dir, os.path.expanduser(path))
+    
+    def tokenize(self, input_line: str) -> List[Tuple[str, bool]]:
+        """Tokenize a command line, treating unbalanced quotes as plain text"""
+        try:
+            return tokenize_command(input_line)
+        except ValueError:
+            # Natural language such as "what's in Documents" is not shell syntax
+            return [(word, False) for word in input_line.split()]
+    
     def parse_command(self, input_line: str) -> tuple[str, List[str]]:
         """Parse a command line into command and arguments"""
-        parts = input_line.strip().split()
+        parts = [token for token, _ in self.tokenize(input_line)]
         if not parts:
             return "", []
         
@@ -444,26 +2476,205 @@ class Terminal:
     
     def execute_command(self, input_line: str) -> str:
         """Execute a command and return the output"""
+        return "".join(self.stream_command(input_line))
+    
+    def parse_pipeline(self, input_line: str) -> List[PipelineStage]:
+        """Parse a command line into pipeline stages with their redirections"""
+        stages = []
+        stage = PipelineStage()
+        tokens = iter(self.tokenize(input_line))
+        
+        for token, is_operator in tokens:
+            if not is_operator:
+                stage.words.append(token)
+            elif token == "|":
+                if not stage.words:
+                    raise ValueError("syntax error near unexpected token `|'")
+                stages.append(stage)
+                stage = PipelineStage()
+            else:
+                target, target_is_operator = next(tokens, ("newline", True))
+                if target_is_operator:
+                    raise ValueError(f"syntax error near unexpected token `{target}'")
+                if token == "<":
+                    stage.input_path = target
+                else:
+                    stage.output_path = target
+                    stage.append = token == ">>"
+        
+        if not stage.words:
+            raise ValueError("syntax error near unexpected token `newline'")
+        stages.append(stage)
+        return stages
+    
+    def stream_command(self, input_line: str) -> Iterator[str]:
+        """Execute a command, yielding its output in chunks as it is produced"""
         if not input_line.strip():
-            return ""
+            return
         
         # Add to history
         self.command_history.append(input_line)
         
         # Parse the command
-        cmd_name, args = self.parse_command(input_line)
+        try:
+            stages = self.parse_pipeline(input_line)
+        except ValueError as e:
+            command_metrics.record("unknown", 0.0, 0, error=True)
+            yield str(e)
+            return
         
-        # Execute the command if it exists
-        if cmd_name in self.commands:
-            return self.commands[cmd_name].execute(args)
-        else:
-            return f"{cmd_name}: command not found"
+        for stage in stages:
+            if stage.name not in self.commands:
+                # Not labelled by name, so typos can't blow up metric cardinality
+                command_metrics.record("unknown", 0.0, 0, error=True)
+                yield f"{stage.name}: command not found"
+                return
+        
+        # Pipelines are accounted to the command that produces the data
+        yield from command_metrics.instrument(stages[0].name, self._run_pipeline(stages))
+    
+    def _run_pipeline(self, stages: List[PipelineStage]) -> Iterator[str]:
+        """Run parsed pipeline stages, yielding the last stage's output"""
+        # Chain the stages lazily: each one pulls chunks from the one before,
+        # so data flows through the pipeline without being accumulated
+        streams: List[Iterator[str]] = []
+        output: Optional[Iterator[str]] = None
+        try:
+            for stage in stages:
+                command = self.commands[stage.name]
+                stdin = output
+                if stage.input_path is not None:
+                    try:
+                        stdin = self._read_file(stage.input_path)
+                    except OSError as e:
+                        yield f"{stage.input_path}: {e.strerror}"
+                        return
+                    streams.append(stdin)
+                
+                if command.reads_stdin:
+                    output = command.stream(stage.args, stdin)
+                else:
+                    output = self._after(stdin, command.stream(stage.args))
+                
+                if stage.output_path is not None:
+                    output = self._write_file(output, stage.output_path, stage.append)
+                streams.append(output)
+            
+            yield from output
+        finally:
+            # Stop upstream stages the last one did not read to the end
+            for stream in reversed(streams):
+                stream.close()
+    
+    def _read_file(self, path: str) -> Iterator[str]:
+        """Open a file for input redirection, returning an iterator of chunks"""
+        f = open(self.resolve_path(path), 'r')
+        
+        def chunks():
+            with f:
+                while True:
+                    chunk = f.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    yield chunk
+        
+        return chunks()
+    
+    def _write_file(self, chunks: Iterator[str], path: str, append: bool) -> Iterator[str]:
+        """Write chunks to a file as they arrive, yielding only error messages"""
+        full_path = self.resolve_path(path)
+        try:
+            f = open(full_path, 'a' if append else 'w')
+        except OSError as e:
+            yield f"{path}: {e.strerror}"
+            return
+        directory_cache.invalidate(full_path)
+        
+        with f:
+            last_chunk = ""
+            for chunk in chunks:
+                if chunk:
+                    f.write(chunk)
+                    last_chunk = chunk
+            # Files end with a newline, as the output would on screen
+            if last_chunk and not last_chunk.endswith("\n"):
+                f.write("\n")
+    
+    def _after(self, stdin: Optional[Iterator[str]], chunks: Iterator[str]) -> Iterator[str]:
+        """Run an upstream stage to completion before a stage that ignores it"""
+        if stdin is not None:
+            for _ in stdin:
+                pass
+        yield from chunks
+    
+    def runs_until_cancelled(self, input_line: str) -> bool:
+        """Whether a command line keeps producing output until it is cancelled"""
+        try:
+            stages = self.parse_pipeline(input_line)
+        except ValueError:
+            return False
+        return any(stage.name in self.commands and self.commands[stage.name].runs_until_cancelled(stage.args)
+                   for stage in stages)
+    
+    def is_blocking(self, input_line: str) -> bool:
+        """Whether running a command line may block on I/O"""
+        try:
+            stages = self.parse_pipeline(input_line)
+        except ValueError:
+            return False
+        
+        for stage in stages:
+            command = self.commands.get(stage.name)
+            if stage.input_path is not None or stage.output_path is not None:
+                return True
+            if command is not None and command.blocking:
+                return True
+        return False
+    
+    async def execute_command_async(self, input_line: str) -> str:
+        """Execute a command without blocking the event loop
+        
+        Blocking commands run on the shared executor; calls for the same
+        terminal should not overlap.
+        """
+        if not self.is_blocking(input_line):
+            return self.execute_command(input_line)
+        
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(get_executor(), self.execute_command, input_line)
+    
+    async def stream_command_async(self, input_line: str) -> AsyncIterator[str]:
+        """Stream a command's output without blocking the event loop"""
+        chunks = self.stream_command(input_line)
+        if not self.is_blocking(input_line):
+            for chunk in chunks:
+                yield chunk
+            return
+        
+        # Each chunk is produced on the executor, so a slow command holds a
+        # worker thread only while it is actually working
+        executor = get_executor()
+        future = None
+        try:
+            while True:
+                future = executor.submit(next, chunks, _END_OF_STREAM)
+                chunk = await asyncio.wrap_future(future)
+                if chunk is _END_OF_STREAM:
+                    break
+                yield chunk
+        finally:
+            # If we were cancelled mid-chunk the generator is still running
+            # on a worker, so close it once that chunk is done
+            if future is not None and not future.done():
+                future.add_done_callback(lambda _: chunks.close())
+            else:
+                chunks.close()
     
     def get_prompt(self) -> str:
         """Get the terminal prompt"""
         username = os.environ.get("USER", "user")
         hostname = platform.node()
-        cwd = os.getcwd()
+        cwd = self.current_dir
         home = os.path.expanduser("~")
         
         # Replace home directory with ~
@@ -472,6 +2683,36 @@ class Terminal:
         
         return f"{username}@{hostname}:{cwd}$ "
     
+    def print_output(self, chunks: Iterator[str]):
+        """Print streamed command output, handling special return values"""
+        last_chunk = ""
+        try:
+            for chunk in chunks:
+                if chunk == "__EXIT__":
+                    self.running = False
+                    print("Goodbye!")
+                    return
+                elif chunk == "__CLEAR__":
+                    # Clear the screen (platform dependent)
+                    os.system('cls' if os.name == 'nt' else 'clear')
+                elif isinstance(chunk, ScreenFrame):
+                    # Redraw in place: cursor home, then clear to the end
+                    sys.stdout.write("\033[H\033[J" + chunk)
+                    sys.stdout.flush()
+                    last_chunk = chunk
+                elif chunk:
+                    sys.stdout.write(chunk)
+                    sys.stdout.flush()
+                    last_chunk = chunk
+        except KeyboardInterrupt:
+            # Ctrl+C stops the running command (such as tail -f), not the terminal
+            chunks.close()
+            last_chunk = "^C"
+        
+        # Leave the prompt on a fresh line
+        if last_chunk and not last_chunk.endswith("\n"):
+            sys.stdout.write("\n")
+    
     def run(self):
         """Run the terminal main loop"""
         print("Python Terminal v1.0")
@@ -483,18 +2724,8 @@ class Terminal:
                 prompt = self.get_prompt()
                 user_input = input(prompt)
                 
-                # Execute the command
-                output = self.execute_command(user_input)
-                
-                # Handle special return values
-                if output == "__EXIT__":
-                    self.running = False
-                    print("Goodbye!")
-                elif output == "__CLEAR__":
-                    # Clear the screen (platform dependent)
-                    os.system('cls' if os.name == 'nt' else 'clear')
-                elif output:
-                    print(output)
+                # Execute the command, printing output as it arrives
+                self.print_output(self.stream_command(user_input))
             
             except KeyboardInterrupt:
                 print("\nUse 'exit' to quit the terminal.")
@@ -3,229 +3,352 @@
 import os
 import sys
 import json
-from flask import Flask, render_template, request, jsonify
+import threading
+from typing import Dict, List, Optional, Tuple
+from flask import Flask, render_template, request, jsonify, g, Response, stream_with_context
 # Import AITerminal instead of Terminal
 from ai_terminal import AITerminal
+from terminal import ScreenFrame
+from session_manager import SessionManager
+from metrics import command_metrics
+
+# WebSocket support is optional; without it the page falls back to HTTP
+try:
+    from flask_sock import Sock
+    from simple_websocket import ConnectionClosed
+except ImportError:
+    Sock = None
 
 app = Flask(__name__)
 
-# Create an AITerminal instance instead of Terminal
-terminal = AITerminal()
+# Each browser gets its own AITerminal, keyed by a session cookie
+SESSION_COOKIE = 'terminal_session'
+MAX_SESSIONS = int(os.environ.get('TERMINAL_MAX_SESSIONS', '100'))
+IDLE_TIMEOUT = float(os.environ.get('TERMINAL_IDLE_TIMEOUT', '1800'))
+
+sessions = SessionManager(AITerminal, max_sessions=MAX_SESSIONS, idle_timeout=IDLE_TIMEOUT)
+
+def get_session():
+    """Return the session for the current request, creating one if needed"""
+    if 'session' not in g:
+        g.session = sessions.get(request.cookies.get(SESSION_COOKIE))
+    return g.session
+
+@app.after_request
+def set_session_cookie(response):
+    session = g.get('session')
+    if session is not None and request.cookies.get(SESSION_COOKIE) != session.session_id:
+        response.set_cookie(SESSION_COOKIE, session.session_id, httponly=True, samesite='Strict')
+    return response
 
 @app.route('/')
 def index():
-    return render_template('index.html')
+    # Start the session here so the cookie is set before the WebSocket opens
+    get_session()
+    return render_template('index.html', websocket=Sock is not None)
+
+def route_command(terminal, command: str) -> str:
+    """Route anything that is not a known command to the NLP command"""
+    if not command.strip() or command.startswith('nlp '):
+        return command
+    # Find the first word the way the terminal will, so operators and
+    # quotes (ls|grep f, cat<f.txt, "ls" /tmp) don't hide the command
+    try:
+        name = terminal.parse_command(command)[0]
+    except ValueError:
+        name = command.split()[0]
+    if name not in terminal.commands:
+        # If it looks like natural language, prepend 'nlp '
+        command = 'nlp ' + command
+    return command
 
 @app.route('/execute', methods=['POST'])
 def execute_command():
     data = request.get_json()
     command = data.get('command', '')
+    session = get_session()
+    terminal = session.terminal
     
-    # Check if this looks like a natural language command
-    if command and not command.split()[0] in terminal.commands and not command.startswith('nlp '):
-        # If it looks like natural language, prepend 'nlp '
-        command = 'nlp ' + command
-    
-    # Execute the command
-    output = terminal.execute_command(command)
+    with session.lock:
+        command = route_command(terminal, command)
+        # A single JSON response can't carry output that never ends
+        if terminal.runs_until_cancelled(command):
+            output = f"{command.split()[0]}: this command runs until cancelled and needs a streaming connection"
+        else:
+            # Execute the command
+            output = terminal.execute_command(command)
+        prompt = terminal.get_prompt()
     
     # Handle special commands
     if output == "__EXIT__":
+        sessions.remove(session.session_id)
         return jsonify({'output': 'Terminal session ended. Refresh the page to start a new session.', 'prompt': ''})
     elif output == "__CLEAR__":
-        return jsonify({'output': '', 'prompt': terminal.get_prompt()})
+        return jsonify({'output': '', 'prompt': prompt})
     else:
-        return jsonify({'output': output, 'prompt': terminal.get_prompt()})
+        return jsonify({'output': output, 'prompt': prompt})
 
-if __name__ == '__main__':
-    # Create templates directory if it doesn't exist
-    os.makedirs('templates', exist_ok=True)
-    
-    # Create the HTML template
-    with open('templates/index.html', 'w') as f:
-        f.write('''
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <meta name="viewport" content="width=device-width, initial-scale=1.0">
-    <title>Python Web Terminal</title>
-    <style>
-        body {
-            font-family: 'Courier New', monospace;
-            background-color: #1e1e1e;
-            color: #f0f0f0;
-            margin: 0;
-            padding: 20px;
-            display: flex;
-            flex-direction: column;
-            height: 100vh;
-        }
-        #terminal {
-            flex-grow: 1;
-            overflow-y: auto;
-            background-color: #0c0c0c;
-            padding: 10px;
-            border-radius: 5px;
-            margin-bottom: 10px;
-            white-space: pre-wrap;
-            word-wrap: break-word;
-        }
-        #input-line {
-            display: flex;
-            margin-bottom: 10px;
-        }
-        #prompt {
-            color: #4CAF50;
-            margin-right: 5px;
-        }
-        #command-input {
-            flex-grow: 1;
-            background-color: #0c0c0c;
-            border: none;
-            color: #f0f0f0;
-            font-family: 'Courier New', monospace;
-            font-size: 1em;
-            outline: none;
-        }
-        .output-text {
-            margin: 0;
-            padding: 0;
-        }
-        .command-text {
-            color: #4CAF50;
-            margin: 0;
-            padding: 0;
-        }
-        .header {
-            text-align: center;
-            margin-bottom: 20px;
-        }
-        .header h1 {
-            color: #4CAF50;
-        }
-    </style>
-</head>
-<body>
-    <div class="header">
-        <h1>Python Web Terminal</h1>
-        <p>A web-based interface for the Python command terminal</p>
-    </div>
-    
-    <div id="terminal">
-        <p class="output-text">Python Web Terminal v1.0</p>
-        <p class="output-text">Type 'help' for a list of commands, 'exit' to end the session.</p>
-    </div>
+# Cap on completions sent per request, so a Tab in a huge directory stays cheap
+MAX_COMPLETIONS = 200
+
+def complete_line(terminal, line: str) -> dict:
+    """Completions for the last word of line, and where that word starts"""
+    completions = terminal.autocomplete_command.complete(line)
+    start = len(line) if not line or line[-1].isspace() else len(line) - len(line.split()[-1])
+    return {
+        'completions': completions[:MAX_COMPLETIONS],
+        'truncated': len(completions) > MAX_COMPLETIONS,
+        'start': start,
+    }
+
+@app.route('/complete')
+def complete():
+    # Completion only reads the terminal, so it doesn't wait for the session
+    # lock (which a long-running command may be holding)
+    return jsonify(complete_line(get_session().terminal, request.args.get('line', '')))
+
+class FrameDiff:
+    """Reduces successive screen frames (live top) to what changed between them
     
-    <div id="input-line">
-        <span id="prompt"></span>
-        <input type="text" id="command-input" autofocus>
-    </div>
+    The first frame is sent whole with 'reset'. After that a frame is sent
+    as the header lines that changed ('header', by index), new rows
+    ('added', all fields), the fields that changed in existing rows
+    ('changed', by field index), the keys of rows that went away
+    ('removed'), and the row order when it differs ('order').
+    """
+    def __init__(self):
+        self.header: Optional[List[str]] = None
+        self.rows: Dict[str, Tuple[str, ...]] = {}
+        self.order: List[str] = []
     
-    <script>
-        const terminal = document.getElementById('terminal');
-        const promptSpan = document.getElementById('prompt');
-        const commandInput = document.getElementById('command-input');
+    def update(self, frame: ScreenFrame) -> Optional[dict]:
+        """Return the changes since the previous frame, or None if there are none"""
+        changes: dict = {}
+        if self.header is None:
+            changes['reset'] = True
+            changes['header'] = dict(enumerate(frame.header))
+        elif frame.header != self.header:
+            changes['header'] = {i: line for i, line in enumerate(frame.header)
+                                 if i >= len(self.header) or self.header[i] != line}
+        if self.header is None or len(frame.header) != len(self.header):
+            changes['header_size'] = len(frame.header)
         
-        // Command history
-        let commandHistory = [];
-        let historyIndex = -1;
-        let currentInput = '';
+        added = {}
+        changed = {}
+        for key, fields in frame.rows:
+            previous = self.rows.get(key)
+            if previous is None or len(previous) != len(fields):
+                added[key] = fields
+            elif previous != fields:
+                changed[key] = {i: field for i, field in enumerate(fields) if previous[i] != field}
+        rows = dict(frame.rows)
+        removed = [key for key in self.rows if key not in rows]
+        order = [key for key, _ in frame.rows]
         
-        // Initialize the prompt
-        fetch('/execute', {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({ command: '' }),
-        })
-        .then(response => response.json())
-        .then(data => {
-            promptSpan.textContent = data.prompt;
-        });
+        if added:
+            changes['added'] = added
+        if changed:
+            changes['changed'] = changed
+        if removed:
+            changes['removed'] = removed
+        if order != self.order:
+            changes['order'] = order
         
-        // Handle command execution
-        commandInput.addEventListener('keydown', function(event) {
-            if (event.key === 'Enter') {
-                const command = commandInput.value;
-                
-                // Add command to terminal
-                const commandElement = document.createElement('p');
-                commandElement.className = 'command-text';
-                commandElement.textContent = promptSpan.textContent + ' ' + command;
-                terminal.appendChild(commandElement);
+        self.header = frame.header
+        self.rows = rows
+        self.order = order
+        return changes or None
+
+def sse_event(payload) -> str:
+    """Encode a payload as one server-sent event"""
+    return f"data: {json.dumps(payload)}\n\n"
+
+@app.route('/execute/stream', methods=['POST'])
+def stream_command():
+    # Same as /execute, but output is sent as server-sent events while the
+    # command produces it instead of being buffered into one JSON response
+    data = request.get_json()
+    command = data.get('command', '')
+    session = get_session()
+    
+    def generate():
+        terminal = session.terminal
+        frames = FrameDiff()
+        with session.lock:
+            for chunk in terminal.stream_command(route_command(terminal, command)):
+                if isinstance(chunk, ScreenFrame):
+                    changes = frames.update(chunk)
+                    if changes:
+                        yield sse_event({'frame': changes})
+                    else:
+                        yield ": keepalive\n\n"
+                elif chunk == "__EXIT__":
+                    sessions.remove(session.session_id)
+                    yield sse_event({'output': 'Terminal session ended. Refresh the page to start a new session.', 'prompt': '', 'done': True})
+                    return
+                elif chunk == "__CLEAR__":
+                    yield sse_event({'clear': True})
+                elif chunk:
+                    yield sse_event({'output': chunk})
+                else:
+                    # Idle heartbeat: a comment line, which also notices
+                    # when the browser has gone away
+                    yield ": keepalive\n\n"
+            yield sse_event({'prompt': terminal.get_prompt(), 'done': True})
+    
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return Response(stream_with_context(generate()), mimetype='text/event-stream', headers=headers)
+
+class TerminalChannel:
+    """A WebSocket connection driving one session's terminal
+    
+    Messages are JSON objects with a 'type'. The client sends 'execute'
+    (with 'command' and an optional 'id') and 'cancel'; the server replies
+    with 'prompt', 'output', 'frame' (see FrameDiff), 'clear', 'exit',
+    'error' and finally 'done' for each command, even one that fails.
+    'complete' (with 'line' and an optional 'id') is answered with
+    'completions', even while a command is running.
+    """
+    def __init__(self, ws, session):
+        self.ws = ws
+        self.session = session
+        self.send_lock = threading.Lock()
+        self.worker = None
+        # Set while a command runs, and cleared before its 'done' is sent:
+        # the worker thread is still alive for a moment after that, so a
+        # client may rightly send the next command before it exits
+        self.busy = False
+        self.cancel_event = threading.Event()
+    
+    def send(self, **payload):
+        """Send one message; output and control messages come from different threads"""
+        with self.send_lock:
+            self.ws.send(json.dumps(payload))
+    
+    def serve(self):
+        """Read client messages until the connection closes"""
+        try:
+            self.send(type='prompt', prompt=self.session.terminal.get_prompt())
+            while True:
+                message = self.ws.receive()
+                if message is None:
+                    break
                 
-                // Add to history
-                if (command.trim() !== '') {
-                    commandHistory.push(command);
-                    historyIndex = commandHistory.length;
-                }
+                # Only the connect went through sessions.get, so keep the
+                # session from being evicted as idle while it is in use
+                if not sessions.touch(self.session):
+                    self.send(type='exit', output='Terminal session expired. Refresh the page to start a new session.')
+                    break
                 
-                // Clear input
-                commandInput.value = '';
+                try:
+                    data = json.loads(message)
+                except ValueError:
+                    self.send(type='error', message='Invalid message')
+                    continue
                 
-                // Execute command
-                fetch('/execute', {
-                    method: 'POST',
-                    headers: {
-                        'Content-Type': 'application/json',
-                    },
-                    body: JSON.stringify({ command: command }),
-                })
-                .then(response => response.json())
-                .then(data => {
-                    if (data.output) {
-                        const outputElement = document.createElement('p');
-                        outputElement.className = 'output-text';
-                        outputElement.textContent = data.output;
-                        terminal.appendChild(outputElement);
-                    }
-                    
-                    if (data.prompt) {
-                        promptSpan.textContent = data.prompt;
-                    }
-                    
-                    // Scroll to bottom
-                    terminal.scrollTop = terminal.scrollHeight;
-                });
-            }
-            else if (event.key === 'ArrowUp') {
-                // Navigate command history (up)
-                if (historyIndex > 0) {
-                    if (historyIndex === commandHistory.length) {
-                        currentInput = commandInput.value;
-                    }
-                    historyIndex--;
-                    commandInput.value = commandHistory[historyIndex];
-                }
-                event.preventDefault();
-            }
-            else if (event.key === 'ArrowDown') {
-                // Navigate command history (down)
-                if (historyIndex < commandHistory.length - 1) {
-                    historyIndex++;
-                    commandInput.value = commandHistory[historyIndex];
-                }
-                else if (historyIndex === commandHistory.length - 1) {
-                    historyIndex++;
-                    commandInput.value = currentInput;
-                }
-                event.preventDefault();
-            }
-        });
+                if data.get('type') == 'execute':
+                    if self.busy:
+                        self.send(type='error', message='A command is already running')
+                        continue
+                    # Run in a worker so this loop stays free to receive 'cancel'
+                    self.busy = True
+                    self.cancel_event = threading.Event()
+                    self.worker = threading.Thread(
+                        target=self.run_command,
+                        args=(data.get('command', ''), data.get('id'), self.cancel_event),
+                        daemon=True)
+                    self.worker.start()
+                elif data.get('type') == 'cancel':
+                    self.cancel_event.set()
+                elif data.get('type') == 'complete':
+                    result = complete_line(self.session.terminal, data.get('line', ''))
+                    self.send(type='completions', id=data.get('id'), **result)
+                else:
+                    self.send(type='error', message=f"Unknown message type: {data.get('type')}")
+        except ConnectionClosed:
+            pass
+        finally:
+            # Stop any running command once nobody is listening
+            self.cancel_event.set()
+    
+    def run_command(self, command: str, command_id, cancel_event: threading.Event):
+        """Execute a command, sending its output until it ends or is cancelled"""
+        terminal = self.session.terminal
+        cancelled = False
+        frames = FrameDiff()
         
-        // Focus input when clicking anywhere in the terminal
-        document.addEventListener('click', function() {
-            commandInput.focus();
-        });
+        try:
+            with self.session.lock:
+                chunks = terminal.stream_command(route_command(terminal, command))
+                try:
+                    # Cancellation takes effect between chunks
+                    for chunk in chunks:
+                        if cancel_event.is_set():
+                            cancelled = True
+                            break
+                        # A long-running command (tail -f, top -d) keeps
+                        # its session alive even without client messages
+                        sessions.touch(self.session)
+                        if isinstance(chunk, ScreenFrame):
+                            changes = frames.update(chunk)
+                            if changes:
+                                self.send(type='frame', **changes)
+                        elif chunk == "__EXIT__":
+                            sessions.remove(self.session.session_id)
+                            self.busy = False
+                            self.send(type='exit', output='Terminal session ended. Refresh the page to start a new session.')
+                            return
+                        elif chunk == "__CLEAR__":
+                            self.send(type='clear')
+                        elif chunk:
+                            self.send(type='output', data=chunk)
+                finally:
+                    chunks.close()
+                prompt = terminal.get_prompt()
+        except ConnectionClosed:
+            return
+        except Exception as e:
+            # The client still needs its 'done' to get the prompt back
+            try:
+                self.send(type='error', message=f"Error: {e}")
+            except ConnectionClosed:
+                return
+            prompt = terminal.get_prompt()
         
-        // Scroll to bottom initially
-        terminal.scrollTop = terminal.scrollHeight;
-    </script>
-</body>
-</html>
-''')
+        self.busy = False
+        try:
+            self.send(type='done', id=command_id, cancelled=cancelled, prompt=prompt)
+        except ConnectionClosed:
+            pass
+
+if Sock is not None:
+    sock = Sock(app)
     
+    @sock.route('/ws')
+    def websocket(ws):
+        TerminalChannel(ws, get_session()).serve()
+
+@app.route('/metrics')
+def metrics():
+    # Prometheus text exposition format
+    session_stats = sessions.stats(include_sessions=False)
+    lines = [
+        command_metrics.render().rstrip("\n"),
+        "# HELP terminal_sessions Live terminal sessions.",
+        "# TYPE terminal_sessions gauge",
+        f"terminal_sessions {session_stats['sessions']}",
+        "# HELP terminal_session_evictions_total Sessions evicted, by reason.",
+        "# TYPE terminal_session_evictions_total counter",
+        f'terminal_session_evictions_total{{reason="idle"}} {session_stats["evicted_idle"]}',
+        f'terminal_session_evictions_total{{reason="lru"}} {session_stats["evicted_lru"]}',
+    ]
+    return Response("\n".join(lines) + "\n", content_type='text/plain; version=0.0.4; charset=utf-8')
+
+@app.route('/stats')
+def stats():
+    # Session counts, evictions and per-session memory for capacity planning
+    return jsonify(sessions.stats(include_sessions=request.args.get('details', '1') != '0'))
+
+if __name__ == '__main__':
     # Run the Flask app
-    app.run(debug=True, host='0.0.0.0', port=8080)
\ No newline at end of file
+    app.run(debug=True, host='0.0.0.0', port=8080)